@@ -1,5 +1,28 @@
+from collections import deque
+import numpy as np
 from TdP_collections.graphs.graph import *
 
+ENGINES = ('hopcroftkarp', 'fordfulkerson')
+
+# Maximum number of bytes of the boolean tiles compared at once to build the dominance relation
+BLOCK_MEMORY = 2**25
+# Maximum number of devices of a side of a tile, small enough for the bounds of a tile to prune the others
+BLOCK_SIZE = 256
+# Number of bits of a bitset of neighbors listed at once by the Hopcroft-Karp algorithm
+CHUNK_BITS = 4096
+
+def _bitIndices(bitset):
+    """
+    Returns the list of the positions of the bits set in a non-negative integer, in increasing order,
+    in O(b) vectorized operations for an integer of b bits: only the non-zero bytes are unpacked.
+    """
+    if bitset == 0:
+        return []
+    packed = np.frombuffer(bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    nonzero = np.flatnonzero(packed)
+    positions, bits = np.nonzero(np.unpackbits(packed[nonzero, None], axis=1, bitorder='little'))
+    return (8 * nonzero[positions] + bits).tolist()
+
 class DeviceSelection:
 
     """
@@ -7,18 +30,29 @@ class DeviceSelection:
     
     Attributes
     ----------
+    _devices : tuple
+        The devices, sorted so that a device can only dominate the devices that follow it.
+    _dominance : list
+        The dominance relation packed in one integer per device: bit k of _dominance[i] is set if
+        _devices[i] dominates _devices[i+1+k].
     _graph : Graph
-        A graph whose vertices are the devices and whose edges represent the dominance relation.
+        A graph whose vertices are the devices and whose edges represent the dominance relation, built by
+        __network() for each run of the Ford-Fulkerson algorithm.
     _start : Vertex
         The vertex representing the start of the graph.
     _end : Vertex
         The vertex representing the end of the graph.
+    _visited : dict
+        A dictionary whose keys are the vertices and whose values are the number of the last BFS that 
+        visited them, shared by all the searches of __FordFulkerson().
+    _epoch : int
+        The number of the last BFS.
     _subsets : dict
         A dictionary whose keys are integer indices and whose values are lists of devices in order of dominance.
         
     Methods
     -------
-    countDevices()
+    countDevices(engine='hopcroftkarp')
         Returns the minimum number C of devices for which we need to run the expensive tests.
     nextDevice()
         Returns the next device to be tested.
@@ -42,82 +76,157 @@ class DeviceSelection:
             
         Time complexity
         ---------------
-        Since first we have a for loop all over the n devices, and then we have to iterate both
-        over the first and the second partition's vertices, then the time complexity is O(n^2).
+        The dominance relation is computed by __dominance() in at most O(n^2*d) vectorized operations, 
+        where d = X-2, and packed in n integers of at most n bits, which take O(n^2) bits instead of the 
+        O(m) edge objects of a graph, with O(n*d) Python operations only to load the performances.
         """
         
-        self._graph = Graph(True)
-        self._start = self._graph.insert_vertex('start')
-        self._end = self._graph.insert_vertex('end')
-        
-        firstPartition = set()
-        secondPartition = set()
+        self._graph = None
+        self._visited = dict()
+        self._epoch = 0
         
-        for elem in N:
-            vertex1 = self._graph.insert_vertex(('firstPartition', elem))
-            firstPartition.add(vertex1)
-            self._graph.insert_edge(self._start, vertex1, 1)
-            vertex2 = self._graph.insert_vertex(('secondPartition', elem))
-            secondPartition.add(vertex2)
-            self._graph.insert_edge(vertex2, self._end, 1)
-            
-        for vertex1 in firstPartition:
-            for vertex2 in secondPartition:
-                if self.__dominates(data[vertex1.element()[1]], data[vertex2.element()[1]], X-2):
-                    self._graph.insert_edge(vertex1, vertex2, 1)
+        performances = np.array([data[elem][:X-2] for elem in N]).reshape(len(N), max(0, X-2))
+        order, self._dominance = self.__dominance(performances)
+        self._devices = tuple(N[i] for i in order.tolist())
            
-    def __dominates(self, t1, t2, size):
+    def __dominance(self, performances):
         """ 
-        Function to check if a device dominates one another.
+        Function to compute the dominance relation, as a bitset per device.
+        
+        The devices are sorted by decreasing sum of their performances, breaking ties by decreasing first
+        performance: since a device that dominates another one has both a larger sum and a larger first 
+        performance, it comes before it. The sorted matrix is split into tiles of at most BLOCK_SIZE 
+        devices, and each tile is compared by broadcasting only with itself and with the following tiles,
+        one coordinate at a time, so that the boolean matrix of the pairs still dominating takes at most 
+        BLOCK_MEMORY bytes, and stopping as soon as none is left. A pair of tiles is skipped as a whole 
+        when, in some coordinate, the maximum of the first tile does not exceed the minimum of the second.
         
         Parameters
         ----------
-        t1 : tuple
-            A tuple of performances of the first device.
-        t2 : tuple
-            A tuple of performances of the second device.
-        size : int
-            The number of elements in the tuple.
+        performances : numpy.ndarray
+            A matrix of size n*d whose i-th row holds the performances of the i-th device.
         
         Returns
         -------
-        True if t1 dominates t2, False otherwise.
+        order : numpy.ndarray
+            The indices of the devices, in sorted order.
+        bitsets : list
+            The integers whose bit k is set if the i-th device in sorted order dominates the (i+1+k)-th one.
+        
+        Time complexity
+        ---------------
+        This function runs in O(n*log(n) + n^2*d) time in the worst case, in vectorized operations, and in 
+        O(BLOCK_MEMORY + BLOCK_SIZE*n + n*d) memory besides the bitsets. About half of the pairs are never
+        compared, the bounds skip the pairs of tiles of devices far apart in some coordinate, and the 
+        comparison of a pair of tiles stops at the first coordinate that leaves no dominating pair.
+        """
+        n, d = performances.shape
+        bitsets = []
+        if n == 0:
+            return np.arange(0), bitsets
+        order = np.lexsort((-performances[:, 0], -performances.sum(axis=1))) if d > 0 else np.arange(n)
+        ordered = performances[order]
+        coordinates = np.ascontiguousarray(ordered.T)
+        block = max(1, min(BLOCK_SIZE, int((BLOCK_MEMORY // 2) ** 0.5)))
+        starts = range(0, n, block)
+        tileMin = np.array([ordered[first:first+block].min(axis=0) for first in starts]).reshape(len(starts), d)
+        tileMax = np.array([ordered[first:first+block].max(axis=0) for first in starts]).reshape(len(starts), d)
+        
+        for r, first in enumerate(starts):
+            # The band holds the comparisons of the devices of the tile with all the following ones
+            band = np.zeros((min(block, n - first), n - first), dtype=bool)
+            candidates = np.flatnonzero((tileMax[r] > tileMin[r:]).all(axis=1)) + r
+            for c in candidates.tolist():
+                second = c * block
+                tile = band[:, second-first:second-first+block]
+                tile[:] = True
+                for k in range(d):
+                    tile &= coordinates[k, first:first+block, None] > coordinates[k, None, second:second+block]
+                    if not tile.any():
+                        break
+            
+            packed = np.packbits(band, axis=1, bitorder='little')
+            for i in range(len(band)):
+                bitsets.append(int.from_bytes(packed[i].tobytes(), 'little') >> (i + 1))
+        
+        return order, bitsets
+    
+    def __network(self):
+        """
+        Builds the flow network of the Ford-Fulkerson algorithm: a source connected to the first partition,
+        an edge from the first to the second partition for each pair of the dominance relation, and the 
+        second partition connected to a sink, all with capacity 1.
         
         Time complexity
         ---------------
-        This function runs at most in O(size) time.
+        This function runs in O(n + m) time, where m is the number of pairs of the dominance relation.
         """
-        for i in range(size):
-            if t1[i] <= t2[i]:
-                return False
-        return True
+        self._graph = Graph(True)
+        self._visited = dict()
+        self._epoch = 0
+        self._start = self._graph.insert_vertex('start')
+        self._end = self._graph.insert_vertex('end')
+        
+        firstPartition = []
+        secondPartition = []
+        for elem in self._devices:
+            vertex1 = self._graph.insert_vertex(('firstPartition', elem))
+            firstPartition.append(vertex1)
+            self._graph.insert_edge(self._start, vertex1, 1)
+            vertex2 = self._graph.insert_vertex(('secondPartition', elem))
+            secondPartition.append(vertex2)
+            self._graph.insert_edge(vertex2, self._end, 1)
+        
+        for i, bitset in enumerate(self._dominance):
+            for k in _bitIndices(bitset):
+                self._graph.insert_edge(firstPartition[i], secondPartition[i + 1 + k], 1)
 
-    def countDevices(self):
+    def countDevices(self, engine='hopcroftkarp'):
         """
         Returns the minimum number C of devices for which we need to run the expensive tests. 
         That is, C is the number of subsets in which the devices are partitioned so that every 
         subset satisfies the non-interleaving property.
         
+        Parameters
+        ----------
+        engine : str
+            The maximum matching algorithm, one of ENGINES: 'hopcroftkarp' runs __HopcroftKarp() on the
+            two partitions, 'fordfulkerson' runs __FordFulkerson() on the flow network. Both of them give
+            a minimum partition.
+        
         Returns
         -------
         count : int
             The minimum number of devices for which we need to run the expensive tests.
+            
+        Raises
+        ------
+        ValueError
+            If the engine is unknown.
 
         Time complexity
         ---------------
-        This function calls the Ford-Fulkerson algorithm on the graph, which runs in O(m*n). Then
-        if loops through the edges incident to the sink vertex, which runs in O(n). Finally, it loops
-        all over the dominators (which have been computed in the previous loop so they have to be
-        less than n) and for each of them it creates a new subset and loops through the dominators
-        in the maxMatching dictionary starting from the current dominator. This takes at most O(n^2).
-        So the time complexity of this function is O(n^2*m).
+        The Hopcroft-Karp algorithm runs in O(m*sqrt(n)), the Ford-Fulkerson algorithm in O(m*n) after
+        building the flow network in O(n + m). Then
+        it finds the dominators, the devices that are not matched as dominated ones, in O(n). Finally, 
+        it loops all over the dominators and for each of them it creates a new subset and follows the
+        maxMatching dictionary starting from the current dominator: since every device is in a single
+        subset, this takes O(n) overall. So the time complexity of this function is O(m*sqrt(n)) with 
+        the Hopcroft-Karp algorithm and O(m*n) with the Ford-Fulkerson one.
         """
-        maxMatching = self.__FordFulkerson(self._graph, self._start, self._end)
-        
-        dominators = []
-        for edge in self._graph.incident_edges(self._end, False):
-            if edge.element() == 1:
-                dominators.append(edge.opposite(self._end).element()[1])
+        if engine == 'hopcroftkarp':
+            maxMatching = self.__HopcroftKarp()
+            dominated = set(maxMatching.values())
+            dominators = [d for d in self._devices if d not in dominated]
+        elif engine == 'fordfulkerson':
+            self.__network()
+            maxMatching = self.__FordFulkerson(self._graph, self._start, self._end)
+            dominators = []
+            for edge in self._graph.incident_edges(self._end, False):
+                if edge.element() == 1:
+                    dominators.append(edge.opposite(self._end).element()[1])
+        else:
+            raise ValueError('Unknown engine: ' + str(engine))
         
         self._subsets = dict()
         count = 0
@@ -133,6 +242,114 @@ class DeviceSelection:
         
         return count
     
+    def __HopcroftKarp(self):
+        """
+        This function performs the Hopcroft-Karp algorithm directly on the bitsets of the dominance relation,
+        without the source, the sink and the residual edges of the flow network. Each phase computes, with
+        a BFS from the unmatched devices of the first partition, the layers of the shortest alternating 
+        paths, up to the first layer adjacent to a free device, and then augments the matching along a 
+        maximal set of vertex-disjoint shortest augmenting paths, found with an iterative DFS that never
+        scans an edge twice in the same phase.
+        
+        The neighbors of a device are never listed in full: the BFS intersects its bitset with the bitset 
+        of the devices of the second partition not reached yet, and the DFS with the bitset of the free 
+        devices and of the devices matched in the next layer, and then lists the result CHUNK_BITS bits
+        at a time, as the search needs them.
+        
+        Returns
+        -------
+        max_matching : dict
+            A dictionary whose keys are the devices of the first partition and whose values are the devices
+            of the second partition they are matched to, as in __FordFulkerson().
+        
+        Time complexity
+        ---------------
+        Let n be the number of devices and m the number of edges between the partitions. Each phase 
+        costs O(m) plus O(n^2) bit operations on the bitsets, executed on machine words, and after 
+        O(sqrt(n)) phases the shortest augmenting paths are so long that only O(sqrt(n)) more 
+        augmentations are possible, so the time complexity is O((m + n^2/w)*sqrt(n)) for words of w bits.
+        """
+        
+        n = len(self._devices)
+        dominance = self._dominance
+        matchFirst = [-1] * n
+        matchSecond = [-1] * n
+        free = (1 << n) - 1
+        
+        while True:
+            # BFS: layers of the alternating paths from the unmatched devices of the first partition, up to
+            # the first layer adjacent to a free device; reached[L] is the bitset of the devices of the 
+            # second partition matched to the layer L
+            layer = [None] * n
+            frontier = [u for u in range(n) if matchFirst[u] == -1]
+            for u in frontier:
+                layer[u] = 0
+            reached = [0]
+            unseen = (1 << n) - 1
+            found = False
+            while frontier:
+                mask = 0
+                for u in frontier:
+                    candidates = (dominance[u] << (u + 1)) & unseen
+                    if candidates == 0:
+                        continue
+                    unseen &= ~candidates
+                    if candidates & free:
+                        found = True
+                    mask |= candidates & ~free
+                if found:
+                    break
+                frontier = []
+                for v in _bitIndices(mask):
+                    w = matchSecond[v]
+                    layer[w] = len(reached)
+                    frontier.append(w)
+                reached.append(mask)
+            if not found:
+                break
+            last = len(reached) - 1
+            
+            # DFS: shortest augmenting paths, that go down one layer at each step and end in a free device
+            # from the last layer; neighbors[u] holds the bitset of the candidates of u not listed yet, the 
+            # position of its first bit and the listed ones
+            neighbors = dict()
+            chosen = dict()
+            for root in range(n):
+                if layer[root] != 0 or matchFirst[root] != -1:
+                    continue
+                stack = [root]
+                while stack:
+                    u = stack[-1]
+                    if u not in neighbors:
+                        allowed = free if layer[u] == last else reached[layer[u] + 1]
+                        neighbors[u] = [dominance[u] & (allowed >> (u + 1)), u + 1, deque()]
+                    entry = neighbors[u]
+                    while not entry[2] and entry[0]:
+                        entry[2].extend(entry[1] + k for k in _bitIndices(entry[0] & ((1 << CHUNK_BITS) - 1)))
+                        entry[0] >>= CHUNK_BITS
+                        entry[1] += CHUNK_BITS
+                    if not entry[2]:
+                        # Dead end: no augmenting path goes through u in this phase
+                        layer[u] = None
+                        stack.pop()
+                        continue
+                    v = entry[2].popleft()
+                    w = matchSecond[v]
+                    if w == -1:
+                        chosen[u] = v
+                        for x in stack:
+                            matchFirst[x] = chosen[x]
+                            matchSecond[chosen[x]] = x
+                            free &= ~(1 << chosen[x])
+                            layer[x] = None
+                        break
+                    if layer[w] is not None and layer[w] == layer[u] + 1:
+                        chosen[u] = v
+                        stack.append(w)
+        
+        devices = self._devices
+        return {devices[u]: devices[v] for u, v in enumerate(matchFirst) if v != -1}
+    
     def __BFS(self, source, sink, path):
         """
         This function performs a BFS on the graph to find an augmenting path from source to sink. An augmenting path
@@ -155,24 +372,26 @@ class DeviceSelection:
         ---------------
         Let n = |X| = |Y| and m = |E| be the number of vertices and edges in the graph. We assume that there is at least one edge
         incident to each node in the original problem and hence m >= n/2. Made this assumption, the time complexity of the BFS
-        O(n+m) is the same as O(m) in such a case. 
+        O(n+m) is the same as O(m) in such a case. The vertices are dequeued in O(1) and, instead of clearing a visited flag on
+        every vertex, each BFS stamps the vertices it reaches with a new epoch, so a search that stops early only pays for the
+        vertices it reached.
         """
 
-        visited = dict()
-        for vertex in self._graph.vertices():
-            visited[vertex] = False
-        queue = []
+        self._epoch += 1
+        epoch = self._epoch
+        visited = self._visited
+        queue = deque()
         queue.append(source)
-        visited[source] = True
+        visited[source] = epoch
         
         while queue:
-            u = queue.pop(0)
+            u = queue.popleft()
             
             for e in self._graph.incident_edges(u):
                 v = e.opposite(u)
-                if not visited[v] and e.element() > 0:
+                if visited.get(v) != epoch and e.element() > 0:
                     queue.append(v)
-                    visited[v] = True
+                    visited[v] = epoch
                     path[v] = u
                     if v == sink:
                         return True
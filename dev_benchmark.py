@@ -0,0 +1,113 @@
+"""
+Benchmarks for DeviceSelection.
+
+Run it from the root of the repository:
+
+    python dev_benchmark.py
+
+or, to measure the peak memory of the construction and of countDevices() on large random inputs:
+
+    python dev_benchmark.py memory 20000 50000 100000
+"""
+
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+from DeviceSelection import DeviceSelection, ENGINES
+
+def read_devices(folder):
+    
+    """
+    Reads the devices of a dev_dataset folder.
+    
+    Returns
+    -------
+    N : tuple
+        the names of the devices
+    X : int
+        the number of performances of each device + 2
+    data : dictionary
+        whose keys are the elements of N and whose values are the lists of their performances
+    """
+    
+    data = dict()
+    f = open(folder + "/data", 'r')
+    for line in f:
+        sline = line.split()
+        if sline:
+            data[sline[0]] = [int(p) for p in sline[1:]]
+    f.close()
+    N = tuple(data.keys())
+    return N, len(data[N[0]]) + 2, data
+
+def random_devices(n, dimension=8, seed=0):
+    
+    """
+    Generates n devices whose dimension performances are drawn uniformly at random from [0, 1000], so
+    that a device dominates another with probability about 1 / 2^dimension.
+    
+    Returns
+    -------
+    N, X, data
+        as in read_devices()
+    """
+    
+    rng = random.Random(seed)
+    N = tuple('D' + str(i) for i in range(n))
+    data = {d: [rng.randint(0, 1000) for _ in range(dimension)] for d in N}
+    return N, dimension + 2, data
+
+def bench_count(N, X, data, label, engines=ENGINES):
+    
+    """
+    Times the construction of DeviceSelection and countDevices() with every engine, and reports the
+    number of augmentations, which is the size of the maximum matching, and their average cost.
+    """
+    
+    for engine in engines:
+        start = perf_counter()
+        ds = DeviceSelection(N, X, data)
+        build = perf_counter() - start
+        start = perf_counter()
+        C = ds.countDevices(engine)
+        count = perf_counter() - start
+        augmentations = len(N) - C
+        print("%14s %14s %7d %7d %10.3fs %10.3fs %12.1fus" % (label, engine, len(N), C, build, count,
+                                                            1e6 * count / max(1, augmentations)))
+
+def bench_memory(sizes=(20000, 50000, 100000), dimension=8):
+    
+    """
+    Reports, for n random devices of every size, the number of pairs of the dominance relation, the size 
+    of its bitsets, and the time and the peak memory traced by tracemalloc of the construction and of 
+    countDevices() with the Hopcroft-Karp engine. The times include the overhead of the tracing.
+    """
+    
+    print("%8s %7s %12s %11s %11s %11s %11s" % ("n", "C", "pairs", "bitsets", "build", "count", "peak"))
+    for n in sizes:
+        N, X, data = random_devices(n, dimension)
+        tracemalloc.start()
+        start = perf_counter()
+        ds = DeviceSelection(N, X, data)
+        build = perf_counter() - start
+        start = perf_counter()
+        C = ds.countDevices('hopcroftkarp')
+        count = perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        pairs = sum(bitset.bit_count() for bitset in ds._dominance)
+        size = sum(sys.getsizeof(bitset) for bitset in ds._dominance)
+        print("%8d %7d %12d %9.1fMB %10.3fs %10.3fs %9.1fMB" % (n, C, pairs, size / 2**20, build, count, 
+                                                              peak / 2**20))
+        del ds
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "memory":
+        bench_memory(tuple(int(n) for n in sys.argv[2:]) or (20000, 50000, 100000))
+        sys.exit(0)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print("%14s %14s %7s %7s %11s %11s %14s" % ("input", "engine", "n", "C", "build", "count", "augmentation"))
+    bench_count(*read_devices("dev_dataset3"), "dev_dataset3")
+    bench_count(*random_devices(n), "random")
@@ -0,0 +1,436 @@
+"""
+Benchmarks for the pos_tagging engines.
+
+Run it from the root of the repository:
+
+    python pos_benchmark.py
+
+or, to time every decoder over a grid of random models and save the results as JSON, so that they can be 
+compared across versions:
+
+    python pos_benchmark.py grid pos_benchmark.json
+"""
+
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+
+from pos_model_file import compile_dataset, load_model
+from pos_tagging import viterbi, viterbi_numpy, viterbi_sparse, viterbi_kbest, pos_tagging, pos_tagging_batch, TaggerModel, PrefixCachedTagger
+
+def read_dataset(folder):
+    
+    """
+    Reads the transition and emission tables of a pos_dataset folder. Roles and words are named after
+    their line index (R0, R1, ... and W0, W1, ...).
+    
+    Parameters
+    ----------
+    folder : str
+        path of the folder holding the transition and emission files
+        
+    Returns
+    -------
+    R : tuple
+        roles
+    S : tuple
+        words, in the order of the emission file
+    T : dictionary
+        transition probabilities
+    E : dictionary
+        emission probabilities
+    """
+    
+    f = open(folder + "/transition", 'r')
+    rows = [line.split() for line in f if line.strip()]
+    f.close()
+    R = tuple('R' + str(i) for i in range(len(rows[0]) - 1))
+    T = dict()
+    for j in range(len(rows)):
+        role = "Start" if j == 0 else R[j-1]
+        T[role] = {r: float(p) for r, p in zip(R + ("End",), rows[j])}
+    
+    f = open(folder + "/emission", 'r')
+    rows = [line.split() for line in f if line.strip()]
+    f.close()
+    S = tuple('W' + str(j) for j in range(len(rows)))
+    E = dict()
+    for j in range(len(rows)):
+        E[S[j]] = {r: float(p) for r, p in zip(R, rows[j])}
+    
+    return R, S, T, E
+
+def random_hmm(K, W, density=1.0, seed=0):
+    
+    """
+    Generates a random model with K roles and W words. Each transition and each emission is non-zero with
+    probability density, and zero entries are omitted from the dictionaries. Every role can move to the 
+    first role R0 and to End, and R0 can emit every word, so that every sentence has a non-zero probability 
+    path.
+    
+    Returns
+    -------
+    R : tuple
+        roles
+    S : tuple
+        the W words
+    T : dictionary
+        transition probabilities
+    E : dictionary
+        emission probabilities
+    """
+    
+    rng = random.Random(seed)
+    R = tuple('R' + str(i) for i in range(K))
+    T = dict()
+    for role in ("Start",) + R:
+        T[role] = {r: rng.random() for r in R + ("End",) if rng.random() < density}
+        T[role][R[0]] = rng.random()
+        T[role]["End"] = rng.random()
+    S = tuple('W' + str(j) for j in range(W))
+    E = dict()
+    for word in S:
+        E[word] = {r: rng.random() for r in R if rng.random() < density}
+        E[word][R[0]] = rng.random()
+    
+    return R, S, T, E
+
+def timeit(function, *args, repeat=5):
+    
+    """
+    Returns the best wall clock time, in seconds, of repeat calls of function(*args).
+    """
+    
+    best = float("Inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function(*args)
+        best = min(best, perf_counter() - start)
+    return best
+
+def peak_memory(function, *args):
+    
+    """
+    Returns the peak memory, in bytes, allocated by a call of function(*args), as traced by tracemalloc.
+    """
+    
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def long_sentence(S, length, seed=0):
+    
+    """
+    Returns a sentence of the given length drawn at random from the words in S.
+    """
+    
+    rng = random.Random(seed)
+    return tuple(rng.choice(S) for _ in range(length))
+
+def bench_log_space(folder="pos_dataset2", lengths=(100, 1000, 10000, 100000)):
+    
+    """
+    Compares the multiply and the log-space paths of both engines on sentences of increasing length built 
+    from the words of folder. For every length it prints the time of each path and how many positions 
+    of the multiply path differ from the log-space one, which is the effect of the underflow.
+    """
+    
+    R, S, T, E = read_dataset(folder)
+    print("log-space vs multiply on", folder)
+    print("%8s %8s %12s %12s %10s" % ("length", "engine", "multiply", "log-space", "differ"))
+    for length in lengths:
+        sentence = long_sentence(S, length)
+        for engine, function in (("python", viterbi), ("numpy", viterbi_numpy)):
+            if engine == "python" and length > 1000:
+                continue
+            repeat = 5 if length <= 1000 else 1
+            probTime = timeit(function, R, sentence, T, E, False, repeat=repeat)
+            logTime = timeit(function, R, sentence, T, E, True, repeat=repeat)
+            probPath = function(R, sentence, T, E, False)
+            logPath = function(R, sentence, T, E, True)
+            differ = sum(1 for p, q in zip(probPath, logPath) if p != q)
+            print("%8d %8s %11.4fs %11.4fs %10d" % (length, engine, probTime, logTime, differ))
+
+def short_sentences(S, count, minLength=3, maxLength=12, seed=0):
+    
+    """
+    Returns a list of count sentences of random length in [minLength, maxLength] drawn from the words in S.
+    """
+    
+    rng = random.Random(seed)
+    return [tuple(rng.choice(S) for _ in range(rng.randint(minLength, maxLength))) for _ in range(count)]
+
+def bench_batch(folder="pos_dataset2", count=5000):
+    
+    """
+    Reports the throughput, in sentences per second, of tagging count short utterances built from the words 
+    of folder one at a time with pos_tagging(), one at a time with a single TaggerModel, and all together 
+    with pos_tagging_batch().
+    """
+    
+    R, S, T, E = read_dataset(folder)
+    sentences = short_sentences(S, count)
+    model = TaggerModel(R, T, E)
+    
+    def single():
+        return [pos_tagging(R, sentence, T, E) for sentence in sentences]
+    def reused():
+        return [model.tag(sentence) for sentence in sentences]
+    def batch():
+        return pos_tagging_batch(R, sentences, T, E)
+    
+    print("batch tagging of", count, "sentences on", folder)
+    for name, function in (("pos_tagging", single), ("TaggerModel.tag", reused), ("pos_tagging_batch", batch)):
+        seconds = timeit(function, repeat=3)
+        print("%20s %12.0f sentences/s" % (name, count / seconds))
+
+def bench_beam(folders=("pos_dataset1", "pos_dataset2", "pos_dataset3"), beams=(1, 2, 5, 10, 20), 
+               thresholds=(0.5, 1.0, 2.0, 5.0), count=50):
+    
+    """
+    Reports how often the beam-pruned decoding differs from the exact Viterbi path, and how long it takes.
+    For every folder the sentence of the dataset and count random sentences of the same length drawn from 
+    its words are decoded in log space, and the fraction of positions and of sentences whose tags differ 
+    from the exact ones is printed for every beam width and every log-probability threshold.
+    """
+    
+    for folder in folders:
+        R, S, T, E = read_dataset(folder)
+        model = TaggerModel(R, T, E)
+        sentences = [S] + [long_sentence(S, len(S), seed) for seed in range(1, count + 1)]
+        exact = [model.decode_indices(sentence, True) for sentence in sentences]
+        exactTime = timeit(lambda: [model.decode_indices(sentence, True) for sentence in sentences], repeat=3)
+        
+        print("beam search on", folder, "(K = %d, T = %d), exact: %.4fs" % (len(R), len(S), exactTime))
+        print("%10s %10s %12s %12s %10s" % ("beam", "threshold", "positions", "sentences", "time"))
+        settings = [(beam, None) for beam in beams if beam < len(R)] + [(None, threshold) for threshold in thresholds]
+        for beam, threshold in settings:
+            paths = [model.decode_indices(sentence, True, beam, threshold) for sentence in sentences]
+            positions = sum(int((path != best).sum()) for path, best in zip(paths, exact))
+            differ = sum(1 for path, best in zip(paths, exact) if (path != best).any())
+            seconds = timeit(lambda: [model.decode_indices(sentence, True, beam, threshold) for sentence in sentences], repeat=3)
+            print("%10s %10s %11.2f%% %11.2f%% %9.4fs" % (beam, threshold, 100 * positions / (len(S) * len(sentences)), 
+                                                          100 * differ / len(sentences), seconds))
+
+def bench_sparse(K=200, length=200, densities=(1.0, 0.2, 0.05, 0.01)):
+    
+    """
+    Compares viterbi_sparse() with viterbi_numpy() and, on the dense model, viterbi() on random models with
+    K roles and decreasing densities of non-zero transitions and emissions.
+    """
+    
+    print("sparse models with K = %d, T = %d" % (K, length))
+    print("%8s %10s %10s %10s %10s" % ("density", "nnz(T)", "sparse", "numpy", "python"))
+    for density in densities:
+        R, S, T, E = random_hmm(K, 1000, density)
+        sentence = long_sentence(S, length)
+        nnz = sum(len(T[r]) for r in R)
+        sparseTime = timeit(viterbi_sparse, R, sentence, T, E, True, repeat=3)
+        numpyTime = timeit(viterbi_numpy, R, sentence, T, E, True, repeat=3)
+        # viterbi() needs the dense dictionaries
+        if density == 1.0:
+            pythonTime = "%9.4fs" % timeit(viterbi, R, sentence, T, E, True, repeat=1)
+        else:
+            pythonTime = "-"
+        print("%8.2f %10d %9.4fs %9.4fs %10s" % (density, nnz, sparseTime, numpyTime, pythonTime))
+
+def bench_checkpoint(folder="pos_dataset2", lengths=(1000, 10000, 100000)):
+    
+    """
+    Compares the time and the peak memory of the full-table decode_indices() with the ones of the 
+    checkpointed decode_checkpointed_indices(), on sentences of increasing length built from the words 
+    of folder.
+    """
+    
+    R, S, T, E = read_dataset(folder)
+    model = TaggerModel(R, T, E)
+    print("checkpointed Viterbi on", folder)
+    print("%8s %10s %10s %9s %12s %12s" % ("length", "full", "checkpoint", "overhead", "full mem", "checkpt mem"))
+    for length in lengths:
+        sentence = long_sentence(S, length)
+        repeat = 3 if length <= 10000 else 1
+        fullTime = timeit(model.decode_indices, sentence, True, repeat=repeat)
+        checkpointTime = timeit(model.decode_checkpointed_indices, sentence, True, repeat=repeat)
+        fullMemory = peak_memory(model.decode_indices, sentence, True)
+        checkpointMemory = peak_memory(model.decode_checkpointed_indices, sentence, True)
+        print("%8d %9.4fs %9.4fs %8.2fx %10.1fKB %10.1fKB" % (length, fullTime, checkpointTime, checkpointTime / fullTime,
+                                                            fullMemory / 1024, checkpointMemory / 1024))
+
+def bench_prefix_cache(folder="pos_dataset2", count=5000, prefixes=20, capacities=(100, 1000, 100000)):
+    
+    """
+    Tags count sentences that start with one of a few shared prefixes, as command utterances do, with and 
+    without a PrefixCachedTagger of increasing capacity, and prints the time and the counters of the cache.
+    """
+    
+    R, S, T, E = read_dataset(folder)
+    model = TaggerModel(R, T, E)
+    rng = random.Random(0)
+    starts = [tuple(rng.choice(S) for _ in range(rng.randint(2, 4))) for _ in range(prefixes)]
+    sentences = [rng.choice(starts) + tuple(rng.choice(S) for _ in range(rng.randint(1, 8))) for _ in range(count)]
+    
+    print("prefix cache on", count, "sentences with", prefixes, "shared prefixes")
+    print("%10s %10s %10s %10s %10s" % ("capacity", "time", "hits", "misses", "evictions"))
+    seconds = timeit(lambda: [model.decode_indices(sentence, True) for sentence in sentences], repeat=1)
+    print("%10s %9.4fs %10s %10s %10s" % ("none", seconds, "-", "-", "-"))
+    for capacity in capacities:
+        cache = PrefixCachedTagger(model, capacity)
+        seconds = timeit(lambda: [cache.decode_indices(sentence) for sentence in sentences], repeat=1)
+        stats = cache.statistics()
+        print("%10d %9.4fs %10d %10d %10d" % (capacity, seconds, stats['hits'], stats['misses'], stats['evictions']))
+
+def bench_model_file(K=50, W=20000, length=100):
+    
+    """
+    Compares the startup time of a model with a vocabulary of W words parsed from the text files of a 
+    dataset folder with the one of the same model mapped from a binary model file, and the time to tag 
+    a first sentence with each of them.
+    """
+    
+    with tempfile.TemporaryDirectory() as directory:
+        rng = random.Random(0)
+        f = open(os.path.join(directory, "transition"), 'w')
+        for _ in range(K + 1):
+            f.write(' '.join(repr(rng.random()) for _ in range(K + 1)) + '\n')
+        f.close()
+        f = open(os.path.join(directory, "emission"), 'w')
+        for _ in range(W):
+            f.write(' '.join(repr(rng.random()) for _ in range(K)) + '\n')
+        f.close()
+        modelFile = os.path.join(directory, "model.hmm")
+        compile_dataset(directory, modelFile)
+        
+        start = perf_counter()
+        R, S, T, E = read_dataset(directory)
+        model = TaggerModel(R, T, E)
+        textTime = perf_counter() - start
+        start = perf_counter()
+        mapped = load_model(modelFile)
+        mapTime = perf_counter() - start
+        
+        sentence = long_sentence(S, length)
+        print("model startup with K = %d, W = %d" % (K, W))
+        print("%12s %12s %12s" % ("", "startup", "first tag"))
+        print("%12s %11.4fs %11.4fs" % ("text", textTime, timeit(model.decode_indices, sentence, True, repeat=1)))
+        print("%12s %11.4fs %11.4fs" % ("mmap", mapTime, timeit(mapped.decode_indices, sentence, True, repeat=1)))
+        del mapped
+
+def grid_decoders(R, S, T, E, density, batch=16, k=3):
+    
+    """
+    Returns the list of the triples (name, function, count) of the decoders timed by bench_grid(), where 
+    function(sentence, log_space) decodes count sentences of the length of a sentence of words in S. The 
+    models are compiled here, so that only the decoding is timed, except for numpy, which is the whole 
+    viterbi_numpy(). The batch decoder decodes, with TaggerModel.decode_batch_indices(), a bucket of batch
+    rotations of the sentence; kbest runs viterbi_kbest() with k paths; posteriors runs 
+    TaggerModel.posteriors(), which has no log space. The python and kbest decoders need the dense 
+    dictionaries and are only returned for density 1.0.
+    """
+    
+    model = TaggerModel(R, T, E)
+    cached = TaggerModel(R, T, E)
+    cached.cache_products(S)
+    
+    def bucket(sentence):
+        return [sentence[j:] + sentence[:j] for j in range(batch)]
+    
+    decoders = [
+        ("numpy", lambda sentence, log_space: viterbi_numpy(R, sentence, T, E, log_space), 1),
+        ("model", model.decode_indices, 1),
+        ("products", cached.decode_indices, 1),
+        ("checkpoint", model.decode_checkpointed_indices, 1),
+        ("beam5", lambda sentence, log_space: model.decode_indices(sentence, log_space, beam=5), 1),
+        ("batch" + str(batch), lambda sentence, log_space: model.decode_batch_indices(bucket(sentence), log_space),
+         batch),
+        ("posteriors", lambda sentence, log_space: model.posteriors(sentence), 1),
+        ("sparse", lambda sentence, log_space: viterbi_sparse(R, sentence, T, E, log_space), 1),
+    ]
+    if density == 1.0:
+        decoders.append(("python", lambda sentence, log_space: viterbi(R, sentence, T, E, log_space), 1))
+        decoders.append(("kbest" + str(k), lambda sentence, log_space: viterbi_kbest(R, sentence, T, E, k, log_space),
+                         1))
+    return decoders
+
+def bench_grid(path=None, Ks=(10, 50, 200), lengths=(10, 100, 1000), densities=(1.0, 0.1), W=1000, repeat=5,
+               maxPythonCells=2 * 10**6):
+    
+    """
+    Times every decoder of grid_decoders(), in probability and in log space, on random models over the grid 
+    of K roles, sentence lengths and densities of non-zero entries, and measures their peak memory. The 
+    time per word of the batch decoder is divided by all the words of its bucket; posteriors, which has no 
+    log space, is only timed once.
+    
+    Parameters
+    ----------
+    path : str
+        if given, the results are also written to this file as JSON
+    Ks, lengths, densities : tuple
+        the values of the grid
+    W : int
+        the number of words of the random models
+    repeat : int
+        the number of timed runs of every decoder, of which the best one is kept
+    maxPythonCells : int
+        the pure Python decoders, python, kbest and sparse, are skipped when K*K*T exceeds this value
+        
+    Returns
+    -------
+    report : dict
+        with the environment of the run and the list of results, one per decoder and configuration, with
+        K, length, density, decoder, log_space, the best time in seconds, the microseconds per word and 
+        the peak memory in bytes
+    """
+    
+    results = []
+    print("%5s %6s %8s %11s %5s %12s %12s" % ("K", "T", "density", "decoder", "log", "us/word", "peak"))
+    for K in Ks:
+        for density in densities:
+            R, S, T, E = random_hmm(K, W, density, seed=K)
+            decoders = grid_decoders(R, S, T, E, density)
+            for length in lengths:
+                sentence = long_sentence(S, length, seed=length)
+                for name, function, count in decoders:
+                    if name in ("python", "sparse") or name.startswith("kbest"):
+                        if K * K * length > maxPythonCells:
+                            continue
+                    for log_space in (False, True):
+                        if name == "posteriors" and log_space:
+                            continue
+                        seconds = timeit(function, sentence, log_space, repeat=repeat)
+                        peak = peak_memory(function, sentence, log_space)
+                        results.append({"K": K, "length": length, "density": density, "decoder": name,
+                                        "log_space": log_space, "seconds": seconds,
+                                        "us_per_word": 1e6 * seconds / (count * length), "peak_bytes": peak})
+                        print("%5d %6d %8.2f %11s %5s %12.2f %12d" % (K, length, density, name, log_space, 
+                                                                     1e6 * seconds / (count * length), peak))
+    
+    report = {"environment": {"python": platform.python_version(), "numpy": np.__version__,
+                              "machine": platform.machine(), "system": platform.system(), "repeat": repeat, 
+                              "words": W},
+              "results": results}
+    if path is not None:
+        f = open(path, 'w')
+        json.dump(report, f, indent=1)
+        f.close()
+    return report
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "grid":
+        bench_grid(sys.argv[2] if len(sys.argv) > 2 else "pos_benchmark.json")
+        sys.exit(0)
+    bench_log_space()
+    bench_batch()
+    bench_beam()
+    bench_sparse()
+    bench_checkpoint()
+    bench_prefix_cache()
+    bench_model_file()
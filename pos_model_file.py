@@ -0,0 +1,179 @@
+"""
+Binary model files for the POS tagger.
+
+A model file holds the roles, the vocabulary and the probability tables of a TaggerModel as float64 
+matrices, so that load_model() can map them in memory instead of parsing text: the startup does not depend 
+on the size of the emission table, and only the pages of the emission rows of the words actually tagged 
+are read from disk.
+
+Layout (all the integers and floats are little-endian):
+
+    magic           8 bytes, b'POSHMM01'
+    K, W            uint64, the number of roles and of words
+    rolesSize       uint64, the size in bytes of the role table
+    wordsSize       uint64, the size in bytes of the word table
+    role table      the roles encoded in UTF-8 and separated by newlines
+    word table      the words encoded in UTF-8 and separated by newlines
+    padding         zero bytes up to a multiple of 8
+    start           K float64
+    transition      K*K float64, row-major
+    end             K float64
+    emission        W*K float64, row-major
+    log tables      the natural logarithms of start, transition, end and emission, in the same layout
+
+The logarithms are stored as well, so that log-space decoding also reads only the rows it needs.
+
+Compile a pos_dataset folder from the command line with:
+
+    python pos_model_file.py pos_dataset2 pos_dataset2.hmm
+"""
+
+import struct
+import sys
+
+import numpy as np
+
+from pos_tagging import TaggerModel, LazyEmissions, log_array
+
+MAGIC = b'POSHMM01'
+HEADER = struct.Struct('<8sQQQQ')
+
+def _read_names(path, prefix, count):
+    """
+    Returns the first count lines of the file at path, or the names prefix+index if it does not exist,
+    as test.py does for the optional roles and sentence files of a dataset.
+    """
+    try:
+        f = open(path, 'r')
+    except FileNotFoundError:
+        return [prefix + str(i) for i in range(count)]
+    names = [f.readline().strip() for _ in range(count)]
+    f.close()
+    return names
+
+def write_model(path, roles, words, start, transition, end, emission):
+    
+    """
+    Writes a binary model file.
+    
+    Parameters
+    ----------
+    path : str
+        the path of the file to write
+    roles : sequence
+        the K roles
+    words : sequence
+        the W words, in the order of the rows of emission
+    start, transition, end : numpy.ndarray
+        the transition probabilities, as returned by pos_tagging.transition_arrays()
+    emission : numpy.ndarray
+        matrix of size W*K with the emission probabilities of the words
+        
+    Raises
+    ------
+    ValueError
+        If the shapes of the arrays do not match the number of roles and words, or a name contains a newline.
+    """
+    
+    K, W = len(roles), len(words)
+    if any('\n' in name for name in list(roles) + list(words)):
+        raise ValueError('Roles and words must not contain newlines')
+    tables = [np.asarray(a, dtype='<f8') for a in (start, transition, end, emission)]
+    if [a.shape for a in tables] != [(K,), (K, K), (K,), (W, K)]:
+        raise ValueError('The shapes of the arrays do not match the number of roles and words')
+    
+    rolesBlob = '\n'.join(roles).encode('utf-8')
+    wordsBlob = '\n'.join(words).encode('utf-8')
+    size = HEADER.size + len(rolesBlob) + len(wordsBlob)
+    
+    f = open(path, 'wb')
+    f.write(HEADER.pack(MAGIC, K, W, len(rolesBlob), len(wordsBlob)))
+    f.write(rolesBlob)
+    f.write(wordsBlob)
+    f.write(bytes(-size % 8))
+    for a in tables + [log_array(a) for a in tables]:
+        f.write(np.ascontiguousarray(a, dtype='<f8').tobytes())
+    f.close()
+
+def compile_dataset(folder, path):
+    
+    """
+    Compiles the transition and emission files of a pos_dataset folder into a binary model file. The roles
+    and the words are read from the optional roles and sentence files of the folder, and are otherwise 
+    named R0, R1, ... and W0, W1, ... after their line index.
+    
+    Parameters
+    ----------
+    folder : str
+        the path of the dataset folder
+    path : str
+        the path of the file to write
+    """
+    
+    transition = np.loadtxt(folder + "/transition", dtype=np.float64, ndmin=2)
+    emission = np.loadtxt(folder + "/emission", dtype=np.float64, ndmin=2)
+    K = transition.shape[1] - 1
+    roles = _read_names(folder + "/roles", 'R', K)
+    words = _read_names(folder + "/sentence", 'W', emission.shape[0])
+    
+    # The first row holds the transitions from Start, the last column the transitions to End
+    write_model(path, roles, words, transition[0, :K], transition[1:, :K], transition[1:, K], emission)
+
+def load_model(path, capacity=None, fallback=None):
+    
+    """
+    Opens a binary model file, mapping its tables in memory.
+    
+    Parameters
+    ----------
+    path : str
+        the path of a file written by write_model() or compile_dataset()
+    capacity : int
+        if given, the emission rows are copied out of the file on demand by a LazyEmissions provider, 
+        which keeps at most capacity of them between two lookups
+    fallback : sequence
+        if given, the K emission probabilities of the out-of-vocabulary words
+        
+    Returns
+    -------
+    model : TaggerModel
+        a model whose arrays are read-only numpy.memmap views of the file
+        
+    Raises
+    ------
+    ValueError
+        If the file is not a binary model file.
+        
+    Time complexity
+    ---------------
+    O(K + W) to read the names and build the index of the words; the tables are not read.
+    """
+    
+    f = open(path, 'rb')
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size or header[:8] != MAGIC:
+        f.close()
+        raise ValueError('Not a binary model file: ' + str(path))
+    _, K, W, rolesSize, wordsSize = HEADER.unpack(header)
+    roles = f.read(rolesSize).decode('utf-8').split('\n') if K > 0 else []
+    words = f.read(wordsSize).decode('utf-8').split('\n') if W > 0 else []
+    f.close()
+    
+    offset = HEADER.size + rolesSize + wordsSize
+    offset += -offset % 8
+    tables = []
+    for shape in ((K,), (K, K), (K,), (W, K)) * 2:
+        tables.append(np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=shape))
+        offset += 8 * int(np.prod(shape))
+    
+    if capacity is None:
+        return TaggerModel.from_arrays(roles, words, *tables[:4], logTables=tuple(tables[4:]), fallback=fallback)
+    
+    emissions = LazyEmissions({w: j for j, w in enumerate(words)}, tables[3].__getitem__, capacity, fallback)
+    return TaggerModel.from_arrays(roles, words, *tables[:3], emissions, logTables=tuple(tables[4:]))
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python pos_model_file.py DATASET_FOLDER MODEL_FILE')
+        sys.exit(1)
+    compile_dataset(sys.argv[1], sys.argv[2])
@@ -0,0 +1,121 @@
+"""
+Parallel POS tagging of large corpora over a pool of processes.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pos_tagging import TaggerModel
+
+# The model of the current worker process, set once by _init_worker
+_model = None
+
+def _init_worker(model):
+    """
+    Initializer of the worker processes: it receives the compiled model once per worker.
+    """
+    global _model
+    _model = model
+
+def _tag_chunk(chunk, log_space):
+    """
+    Tags a chunk of sentences with the model of the current worker.
+    """
+    return _model.tag_batch(chunk, log_space)
+
+def _chunks(sentences, chunk_size):
+    """
+    Splits the iterable sentences into lists of at most chunk_size sentences.
+    """
+    chunk = []
+    for sentence in sentences:
+        chunk.append(sentence)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def tag_corpus(model, sentences, workers=None, chunk_size=256, log_space=False):
+    
+    """
+    Tags a corpus with a compiled model, sharding it across a ProcessPoolExecutor.
+    
+    The model is sent to every worker only once, by the initializer of the pool, while the tasks only 
+    carry the chunks of sentences. At most two chunks per worker are in flight at any time, so an iterator
+    of unbounded length can be consumed in constant memory.
+    
+    Parameters
+    ----------
+    model : TaggerModel
+        the compiled model
+    sentences : iterable
+        tuples of words, all of them in the vocabulary of the model
+    workers : int
+        number of worker processes, by default the number of CPUs
+    chunk_size : int
+        number of sentences sent to a worker in a single task
+    log_space : bool
+        if True the paths are decoded summing log-probabilities
+        
+    Returns
+    -------
+    tags : generator
+        the dictionaries that model.tag() returns for each sentence, in input order
+        
+    Raises
+    ------
+    ValueError
+        If workers or chunk_size are not positive.
+    """
+    
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1 or chunk_size < 1:
+        raise ValueError('workers and chunk_size must be positive')
+    return _tag_corpus(model, sentences, workers, chunk_size, log_space)
+
+def _tag_corpus(model, sentences, workers, chunk_size, log_space):
+    """
+    The generator of tag_corpus(), separated from it so that the arguments are checked when tag_corpus()
+    is called rather than on the first iteration.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as executor:
+        pending = deque()
+        for chunk in _chunks(sentences, chunk_size):
+            pending.append(executor.submit(_tag_chunk, chunk, log_space))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def pos_tagging_corpus(R, sentences, T, E, workers=None, chunk_size=256, log_space=False):
+    
+    """
+    Tags a corpus in parallel: it compiles a TaggerModel from R, T and E and calls tag_corpus().
+    
+    Parameters
+    ----------
+    R : tuple 
+        roles
+    sentences : iterable
+        tuples of words, each of them as the parameter S of pos_tagging()
+    T : dictionary
+        transition probabilities, as in pos_tagging()
+    E : dictionary
+        emission probabilities, as in pos_tagging(); its keys must include every word of every sentence
+    workers : int
+        number of worker processes, by default the number of CPUs
+    chunk_size : int
+        number of sentences sent to a worker in a single task
+    log_space : bool
+        if True the paths are decoded summing log-probabilities
+        
+    Returns
+    -------
+    tags : list
+        the dictionaries that pos_tagging() returns for each sentence, in input order
+    """
+    
+    return list(tag_corpus(TaggerModel(R, T, E), sentences, workers, chunk_size, log_space))
@@ -0,0 +1,246 @@
+"""
+An asyncio front-end of the POS tagger, for network services.
+
+Tagging a sentence on the event loop blocks every other request for the whole decoding. TaggingService
+collects the sentences of concurrent requests for a few milliseconds, decodes them together with
+TaggerModel.tag_batch() in an executor, so that the event loop stays free, and resolves the future of
+every request.
+
+Measure the latency of the service on thousands of concurrent requests with:
+
+    python pos_service.py pos_dataset2
+"""
+
+import asyncio
+import sys
+from time import perf_counter
+
+from pos_tagging import TaggerModel
+
+class TaggingService:
+    
+    """
+    Micro-batching tagging service.
+    
+    A batch is decoded as soon as it holds max_batch_size sentences, or max_wait seconds after its first
+    sentence arrived, whichever comes first. The batches run in an executor, by default the one of the
+    event loop, so several of them can be decoded while the loop keeps accepting requests.
+    
+    Attributes
+    ----------
+    _model : TaggerModel
+        The compiled model.
+    _maxBatchSize : int
+        The maximum number of sentences decoded together.
+    _maxWait : float
+        The maximum time, in seconds, that a sentence waits for its batch to fill.
+    _executor : concurrent.futures.Executor
+        The executor of the batches, or None for the default executor of the event loop.
+    _logSpace : bool
+        True if the paths are decoded summing log-probabilities.
+    _pending : list
+        The pairs (sentence, future) of the batch being collected.
+    _timer : asyncio.TimerHandle
+        The scheduled flush of the batch being collected, or None.
+    _tasks : set
+        The batches being decoded.
+    
+    Methods
+    -------
+    tag(sentence)
+        Coroutine that returns the dictionary of the roles assigned to the words of the sentence.
+    flush()
+        Starts the decoding of the batch being collected.
+    close()
+        Coroutine that decodes the pending sentences and waits for every batch.
+    """
+    
+    def __init__(self, model, max_batch_size=64, max_wait=0.002, executor=None, log_space=False):
+        """
+        Parameters
+        ----------
+        model : TaggerModel
+            the compiled model
+        max_batch_size : int
+            maximum number of sentences decoded together
+        max_wait : float
+            maximum time, in seconds, that a sentence waits for its batch to fill
+        executor : concurrent.futures.Executor
+            executor of the batches, by default the one of the event loop
+        log_space : bool
+            if True the paths are decoded summing log-probabilities
+        
+        Raises
+        ------
+        ValueError
+            If max_batch_size is not positive or max_wait is negative.
+        """
+        if max_batch_size < 1 or max_wait < 0:
+            raise ValueError('max_batch_size must be positive and max_wait not negative')
+        self._model = model
+        self._maxBatchSize = max_batch_size
+        self._maxWait = max_wait
+        self._executor = executor
+        self._logSpace = log_space
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+    
+    async def tag(self, sentence):
+        """
+        Tags a sentence together with the other sentences received in the same batch.
+        
+        Parameters
+        ----------
+        sentence : tuple
+            words in the vocabulary of the model, or out of it if the model has a fallback
+        
+        Returns
+        -------
+        tags : dict
+            the dictionary that TaggerModel.tag() returns for the sentence
+        
+        Raises
+        ------
+        KeyError
+            If a word is not in the vocabulary of the model and the model has no fallback; the other
+            sentences of the batch are not affected.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((sentence, future))
+        if len(self._pending) >= self._maxBatchSize:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._maxWait, self.flush)
+        return await future
+    
+    def flush(self):
+        """
+        Starts the decoding of the batch being collected, if any.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch = self._pending
+        self._pending = []
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch):
+        """
+        Decodes a batch in the executor and resolves the futures of its sentences.
+        """
+        loop = asyncio.get_running_loop()
+        sentences = [sentence for sentence, _ in batch]
+        try:
+            results = await loop.run_in_executor(self._executor, self._model.tag_batch, sentences, self._logSpace)
+        except Exception:
+            # A single bad sentence fails the whole batch: decode them one at a time to isolate it
+            results = await loop.run_in_executor(self._executor, self._tag_each, sentences)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    def _tag_each(self, sentences):
+        """
+        Returns, for each sentence, its tags or the exception raised while tagging it.
+        """
+        results = []
+        for sentence in sentences:
+            try:
+                results.append(self._model.tag(sentence, self._logSpace))
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    async def close(self):
+        """
+        Decodes the sentences still being collected and waits for the end of every batch.
+        """
+        self.flush()
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+def percentile(values, q):
+    
+    """
+    Returns the q-th percentile, with q between 0 and 100, of a non-empty list of values, by the nearest
+    rank method.
+    """
+    
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+async def _drive(service, sentences, concurrency):
+    """
+    Sends the sentences to the service from concurrency clients, each waiting for its answer before sending
+    the next sentence, and returns the latency of every request.
+    """
+    latencies = []
+    position = iter(range(len(sentences)))
+    
+    async def client():
+        for j in position:
+            start = perf_counter()
+            await service.tag(sentences[j])
+            latencies.append(perf_counter() - start)
+    
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    await service.close()
+    return latencies
+
+def measure_latency(model, sentences, concurrency=1000, max_batch_size=64, max_wait=0.002, log_space=False):
+    
+    """
+    Drives a TaggingService with concurrent requests and measures their latency.
+    
+    Parameters
+    ----------
+    model : TaggerModel
+        the compiled model
+    sentences : list
+        the sentences to tag, one request each
+    concurrency : int
+        the number of clients sending requests at the same time
+    max_batch_size, max_wait, log_space
+        as in TaggingService
+    
+    Returns
+    -------
+    report : dict
+        the number of requests, the throughput in requests per second, and the p50 and p99 latencies in
+        seconds
+    """
+    
+    async def main():
+        service = TaggingService(model, max_batch_size, max_wait, log_space=log_space)
+        start = perf_counter()
+        latencies = await _drive(service, sentences, concurrency)
+        return latencies, perf_counter() - start
+    
+    latencies, elapsed = asyncio.run(main())
+    return {'requests': len(latencies), 'throughput': len(latencies) / elapsed,
+            'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99)}
+
+if __name__ == '__main__':
+    from pos_benchmark import read_dataset, short_sentences
+    
+    folder = sys.argv[1] if len(sys.argv) > 1 else "pos_dataset2"
+    R, S, T, E = read_dataset(folder)
+    model = TaggerModel(R, T, E)
+    sentences = short_sentences(S, 5000, seed=0)
+    print("5000 requests from 1000 concurrent clients on", folder)
+    print("%10s %10s %12s %10s %10s" % ("batch", "wait", "requests/s", "p50", "p99"))
+    for maxBatchSize, maxWait in ((1, 0), (16, 0.001), (64, 0.002), (256, 0.005)):
+        report = measure_latency(model, sentences, 1000, maxBatchSize, maxWait)
+        print("%10d %9.1fms %12.0f %8.2fms %8.2fms" % (maxBatchSize, 1000 * maxWait, report['throughput'],
+                                                       1000 * report['p50'], 1000 * report['p99']))
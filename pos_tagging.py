@@ -1,4 +1,13 @@
-def pos_tagging(R, S, T, E):
+import math
+from array import array
+from collections import deque, OrderedDict
+import numpy as np
+from TdP_collections.priority_queue.heap_priority_queue import HeapPriorityQueue
+
+ENGINES = ('numpy', 'python', 'sparse')
+OUTPUTS = ('dict', 'roles', 'indices')
+
+def pos_tagging(R, S, T, E, engine='numpy', log_space=False, output='dict'):
     
     """
     Parameters
@@ -15,15 +24,53 @@ def pos_tagging(R, S, T, E):
         whose keys are the strings in S and value are dictionaries E[s] such that
         - the keys of E[s] are the roles in R
         - the values in E[s] are the emission probabilities between s and the corresponding role defined by the key
+    engine : str
+        the Viterbi implementation to use, one of ENGINES: 'numpy' compiles a TaggerModel of the words 
+        of S and decodes them on dense arrays, 'python' runs the pure Python viterbi() on the dictionaries, 'sparse' runs 
+        viterbi_sparse(), which only visits the non-zero probabilities. All of them return the same tags.
+    log_space : bool
+        if True the path is decoded summing log-probabilities instead of multiplying probabilities,
+        which avoids the underflow of the products on long sentences.
+    output : str
+        the format of the result, one of OUTPUTS: 'dict' for the dictionary of the tags of the words,
+        'roles' for the list of the roles aligned to S, 'indices' for the numpy.ndarray of the indices 
+        in R of the roles aligned to S. The last two keep a tag for every occurrence of a repeated word.
         
     Returns
     -------
     tags : dictionary 
         whose keys are the words in S and the values are the roles assigned to these words, 
         so that the selected assignment is the one of maximum likelihood.
+        If a word occurs more than once, only the role of its last occurrence is kept.
+        With the output 'roles' or 'indices', the list or array of the roles of the words of S.
+        
+    Raises
+    ------
+    ValueError
+        If engine is not one of ENGINES or output is not one of OUTPUTS.
     """
     
-    result = viterbi(R, S, T, E)
+    if output not in OUTPUTS:
+        raise ValueError('Unknown output: ' + str(output))
+    
+    if engine == 'numpy':
+        # Only the rows of the words of S are compiled, so the cost does not depend on the size of E
+        indices = TaggerModel(R, T, {s: E[s] for s in S}).decode_indices(S, log_space)
+        if output == 'indices':
+            return indices
+        result = [R[i] for i in indices]
+    elif engine == 'python':
+        result = viterbi(R, S, T, E, log_space)
+    elif engine == 'sparse':
+        result = viterbi_sparse(R, S, T, E, log_space)
+    else:
+        raise ValueError('Unknown engine: ' + str(engine))
+    
+    if output == 'roles':
+        return result
+    if output == 'indices':
+        index = {r: i for i, r in enumerate(R)}
+        return np.array([index[r] for r in result], dtype=np.intp)
     
     i = 0
     tags = dict()
@@ -33,7 +80,1237 @@ def pos_tagging(R, S, T, E):
         
     return tags
 
-def viterbi(R, S, T, E):
+def pos_tagging_batch(R, sentences, T, E, log_space=False, output='dict'):
+    
+    """
+    Tags many sentences at once. The sentences are bucketed by length and every bucket is decoded by a 
+    single vectorized Viterbi pass over a 3-D (batch * time * role) array. Only the emission rows of the
+    distinct words of the sentences are compiled.
+    
+    Parameters
+    ----------
+    R : tuple 
+        roles
+    sentences : iterable
+        tuples of words, each of them as the parameter S of pos_tagging()
+    T : dictionary
+        transition probabilities, as in pos_tagging()
+    E : dictionary
+        emission probabilities, as in pos_tagging(); its keys must include every word of every sentence
+    log_space : bool
+        if True the paths are decoded summing log-probabilities
+    output : str
+        the format of the result of each sentence, one of OUTPUTS, as in pos_tagging()
+        
+    Returns
+    -------
+    tags : list
+        the list of the results that pos_tagging() returns for each sentence, in input order
+        
+    Raises
+    ------
+    ValueError
+        If output is not one of OUTPUTS.
+    """
+    
+    if output not in OUTPUTS:
+        raise ValueError('Unknown output: ' + str(output))
+    sentences = list(sentences)
+    model = TaggerModel(R, T, {s: E[s] for sentence in sentences for s in sentence})
+    if output == 'dict':
+        return model.tag_batch(sentences, log_space)
+    if output == 'indices':
+        return model.decode_batch_indices(sentences, log_space)
+    roles = model.roles()
+    return [[roles[i] for i in path] for path in model.decode_batch_indices(sentences, log_space)]
+
+class EmissionProvider:
+    
+    """
+    The source of the emission probabilities of a TaggerModel: an index from the words to the ids of their 
+    rows, plus a store of the rows.
+    
+    The decoders never see the whole emission table through a provider: lookup() returns only the rows of 
+    the words of the current sentence or batch, together with the position of the row of every word. A 
+    configurable fallback distribution over the roles is used for the words that are not in the index.
+    
+    Subclasses implement row_id() and _fetch().
+    
+    Attributes
+    ----------
+    _fallback : numpy.ndarray
+        Array of size K with the emission probabilities of the out-of-vocabulary words, or None if they
+        raise KeyError.
+    _logFallback : numpy.ndarray
+        The logarithm of _fallback, or None.
+        
+    Methods
+    -------
+    row_id(word)
+        Returns the id of the row of the word, or None if the word is not in the index.
+    lookup(words, log_space=False)
+        Returns the rows needed by a sequence of words and the position of the row of every word.
+    row(word, log_space=False)
+        Returns the row of a single word.
+    """
+    
+    def __init__(self, fallback=None):
+        """
+        Parameters
+        ----------
+        fallback : sequence
+            if given, the K emission probabilities, in the order of the roles of the model, used for 
+            the out-of-vocabulary words
+        """
+        if fallback is None:
+            self._fallback = self._logFallback = None
+        else:
+            self._fallback = np.asarray(fallback, dtype=np.float64)
+            self._logFallback = log_array(self._fallback)
+            
+    def row_id(self, word):
+        """
+        Returns the id of the row of the word, or None if the word is not in the index.
+        """
+        raise NotImplementedError('must be implemented by subclass')
+        
+    def _fetch(self, ids, log_space):
+        """
+        Returns the matrix of size len(ids)*K with the rows of the given ids, as probabilities or 
+        log-probabilities.
+        """
+        raise NotImplementedError('must be implemented by subclass')
+        
+    def lookup(self, words, log_space=False):
+        """
+        Returns the emission rows needed by a sequence of words.
+        
+        Parameters
+        ----------
+        words : sequence
+            words, either in the index or, if the provider has a fallback, out of vocabulary
+        log_space : bool
+            if True the rows hold log-probabilities
+            
+        Returns
+        -------
+        table : numpy.ndarray
+            matrix with one row for each distinct word, of K probabilities or log-probabilities
+        rows : numpy.ndarray
+            array of size len(words) whose j-th entry is the index in table of the row of the j-th word
+            
+        Raises
+        ------
+        KeyError
+            If a word is not in the index and the provider has no fallback.
+            
+        Time complexity
+        ---------------
+        O(T) dictionary lookups plus O(U*K) to copy the rows of the U distinct words.
+        """
+        positions = dict()
+        ids = []
+        rows = np.empty(len(words), dtype=np.intp)
+        for j, w in enumerate(words):
+            p = positions.get(w)
+            if p is None:
+                i = self.row_id(w)
+                if i is None and self._fallback is None:
+                    raise KeyError(w)
+                p = positions[w] = len(ids)
+                ids.append(i)
+            rows[j] = p
+        
+        known = [i for i in ids if i is not None]
+        if len(known) == len(ids):
+            return self._fetch(known, log_space), rows
+        fallback = self._logFallback if log_space else self._fallback
+        table = np.empty((len(ids), len(fallback)))
+        isKnown = np.array([i is not None for i in ids], dtype=bool)
+        if len(known) > 0:
+            table[isKnown] = self._fetch(known, log_space)
+        table[~isKnown] = fallback
+        return table, rows
+        
+    def row(self, word, log_space=False):
+        """
+        Returns the array of size K with the emission probabilities, or log-probabilities, of the word.
+        
+        Raises
+        ------
+        KeyError
+            If the word is not in the index and the provider has no fallback.
+        """
+        i = self.row_id(word)
+        if i is not None:
+            return self._fetch([i], log_space)[0]
+        if self._fallback is None:
+            raise KeyError(word)
+        return self._logFallback if log_space else self._fallback
+
+class DenseEmissions(EmissionProvider):
+    
+    """
+    An emission provider that keeps the whole W*K emission matrix, in memory or mapped from a file.
+    
+    When every word of a sentence is in the vocabulary, lookup() returns the matrix itself with the row
+    indices of the words, without copying any row. Several words can share the same row, as in the
+    providers built by deduplicated().
+    
+    Attributes
+    ----------
+    _index : dict
+        A dictionary whose keys are the words and whose values are the indices of their rows in _emission.
+    _emission : numpy.ndarray
+        Matrix of size U*K with the U distinct emission rows of the known words.
+    _logEmission : numpy.ndarray
+        The logarithm of _emission, computed on first use unless given to the constructor.
+        
+    Methods
+    -------
+    deduplicated(words, emission, fallback=None)
+        Builds a provider that keeps a single copy of the identical rows of emission.
+    """
+    
+    def __init__(self, words, emission, logEmission=None, fallback=None, rows=None):
+        """
+        Parameters
+        ----------
+        words : sequence
+            the W words of the vocabulary, in the order of the rows of emission
+        emission : numpy.ndarray
+            matrix with the emission probabilities of the words
+        logEmission : numpy.ndarray
+            if given, the logarithm of emission
+        fallback : sequence
+            as in EmissionProvider
+        rows : sequence
+            if given, the index of the row of emission of each word; by default the j-th word has the j-th row
+        """
+        super().__init__(fallback)
+        if rows is None:
+            self._index = {w: j for j, w in enumerate(words)}
+        else:
+            self._index = {w: int(j) for w, j in zip(words, rows)}
+        self._emission = emission
+        self._logEmission = logEmission
+        
+    @classmethod
+    def deduplicated(cls, words, emission, fallback=None):
+        """
+        Builds a provider that keeps a single copy of the identical rows of emission, as those of the 
+        closed-class words or of the classes of rare words.
+        
+        Parameters
+        ----------
+        words : sequence
+            the W words of the vocabulary, in the order of the rows of emission
+        emission : numpy.ndarray
+            matrix of size W*K with the emission probabilities of the words
+        fallback : sequence
+            as in EmissionProvider
+            
+        Returns
+        -------
+        provider : DenseEmissions
+            a provider whose matrix holds only the U distinct rows of emission
+            
+        Time complexity
+        ---------------
+        O(W*K*log(W)) to sort the rows.
+        """
+        distinct, rows = np.unique(emission, axis=0, return_inverse=True)
+        return cls(words, distinct, fallback=fallback, rows=rows.reshape(-1))
+        
+    def _table(self, log_space):
+        """
+        Returns the emission matrix, of probabilities or log-probabilities.
+        """
+        if not log_space:
+            return self._emission
+        if self._logEmission is None:
+            self._logEmission = log_array(self._emission)
+        return self._logEmission
+        
+    def row_id(self, word):
+        return self._index.get(word)
+        
+    def _fetch(self, ids, log_space):
+        return self._table(log_space)[ids]
+        
+    def lookup(self, words, log_space=False):
+        index = self._index
+        try:
+            rows = np.array([index[w] for w in words], dtype=np.intp)
+        except KeyError:
+            if self._fallback is None:
+                raise
+            return super().lookup(words, log_space)
+        return self._table(log_space), rows
+        
+    def row(self, word, log_space=False):
+        i = self._index.get(word)
+        if i is None:
+            return super().row(word, log_space)
+        return self._table(log_space)[i]
+
+class LazyEmissions(EmissionProvider):
+    
+    """
+    An emission provider that loads the rows on demand and keeps only the most recently used ones.
+    
+    The rows are read through a loader, for instance from a memory-mapped file or a database, and are
+    kept, together with their logarithms, in a least recently used cache of bounded capacity. The rows 
+    needed by a sentence or a batch are all resident while it is decoded, even when they are more than
+    the capacity; the least recently used ones are evicted right after.
+    
+    Attributes
+    ----------
+    _index : dict
+        A mapping whose keys are the words and whose values are the ids of their rows.
+    _loader : callable
+        A function that receives the id of a row and returns its K emission probabilities.
+    _capacity : int
+        The maximum number of rows kept between two lookups.
+    _cache : OrderedDict
+        A dictionary whose keys are the ids of the cached rows and whose values are the pairs
+        (probabilities, log-probabilities), from the least to the most recently used.
+    _hits, _misses : int
+        The number of rows found in the cache and loaded.
+        
+    Methods
+    -------
+    statistics()
+        Returns the counters of the cache.
+    clear()
+        Empties the cache.
+    """
+    
+    def __init__(self, index, loader, capacity=4096, fallback=None):
+        """
+        Parameters
+        ----------
+        index : mapping
+            whose keys are the words of the vocabulary and whose values are the ids of their rows
+        loader : callable
+            function that receives the id of a row and returns the sequence of its K emission probabilities
+        capacity : int
+            maximum number of rows kept in the cache, at least 1
+        fallback : sequence
+            as in EmissionProvider
+            
+        Raises
+        ------
+        ValueError
+            If capacity is lower than 1.
+        """
+        if capacity < 1:
+            raise ValueError('The capacity must be at least 1')
+        super().__init__(fallback)
+        self._index = index
+        self._loader = loader
+        self._capacity = capacity
+        self._cache = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        
+    def row_id(self, word):
+        return self._index.get(word)
+        
+    def _fetch(self, ids, log_space):
+        cache = self._cache
+        pairs = []
+        for i in ids:
+            pair = cache.get(i)
+            if pair is None:
+                probs = np.array(self._loader(i), dtype=np.float64)
+                pair = cache[i] = (probs, log_array(probs))
+                self._misses += 1
+            else:
+                cache.move_to_end(i)
+                self._hits += 1
+            pairs.append(pair[1] if log_space else pair[0])
+        
+        while len(cache) > self._capacity:
+            cache.popitem(last=False)
+        
+        if len(pairs) == 0:
+            return np.empty((0, 0 if self._fallback is None else len(self._fallback)))
+        return np.stack(pairs)
+        
+    def statistics(self):
+        """
+        Returns a dictionary with the number of rows found in the cache (hits), loaded (misses), currently
+        cached (size) and the capacity of the cache.
+        """
+        return {'hits': self._hits, 'misses': self._misses, 'size': len(self._cache), 'capacity': self._capacity}
+        
+    def clear(self):
+        """
+        Empties the cache, keeping its counters.
+        """
+        self._cache.clear()
+
+class TaggerModel:
+    
+    """
+    A hidden Markov model compiled once from R, T and E, that can tag any number of sentences.
+    
+    The nested dictionaries are walked only by the constructor: the model keeps the index of every role,
+    the transition probabilities as contiguous arrays and the emission probabilities as a matrix with
+    one row per word, so that tagging a sentence only costs a lookup per word plus the Viterbi recurrence.
+    The emission probabilities can also come from any EmissionProvider, such as LazyEmissions, which only
+    loads the rows of the words being tagged.
+    
+    Attributes
+    ----------
+    _roles : tuple
+        The roles, in the order of the rows and columns of the arrays.
+    _roleIndex : dict
+        A dictionary whose keys are the roles and whose values are their indices in _roles.
+    _start : numpy.ndarray
+        Array of size K with the transition probabilities from Start.
+    _transition : numpy.ndarray
+        C-contiguous matrix of size K*K with the transition probabilities between roles.
+    _end : numpy.ndarray
+        Array of size K with the transition probabilities to End.
+    _emissions : EmissionProvider
+        The source of the emission rows of the words.
+    _logTables : tuple
+        The logarithms of _start, _transition and _end, computed on first use.
+    _productSlots : dict
+        A dictionary whose keys are the ids of the emission rows with precomputed products and whose 
+        values are the indices of their products in _products.
+    _products : tuple
+        The arrays of size P*K*K of the products T ⊙ E[w] of the P cached rows, as probabilities and as
+        log-probabilities, or None.
+        
+    Methods
+    -------
+    from_arrays(roles, words, start, transition, end, emission, logTables=None, fallback=None)
+        Builds a model directly from its arrays.
+    roles()
+        Returns the tuple of the roles of the model.
+    emissions()
+        Returns the EmissionProvider of the model.
+    cache_products(words, budget=2**25)
+        Precomputes the products of the transition matrix and the emission rows of the most frequent words.
+    tag(sentence, log_space=False, beam=None, threshold=None)
+        Returns the dictionary of the roles assigned to the words of the sentence.
+    decode(sentence, log_space=False, beam=None, threshold=None)
+        Returns the most likely sequence of roles of the sentence.
+    decode_indices(sentence, log_space=False, beam=None, threshold=None)
+        Returns the indices of the most likely sequence of roles of the sentence.
+    decode_checkpointed_indices(sentence, log_space=False, segment=None)
+        Returns the same indices as decode_indices(), in O(K * sqrt(T)) memory.
+    posteriors(sentence)
+        Returns the posterior probabilities of the roles of every word and the log-likelihood of the sentence.
+    tag_batch(sentences, log_space=False, batch_size=1024)
+        Returns the list of the dictionaries of the roles assigned to the words of each sentence.
+    decode_batch_indices(sentences, log_space=False, batch_size=1024)
+        Returns the list of the indices of the most likely sequence of roles of each sentence.
+    """
+    
+    def __init__(self, R, T, E, fallback=None):
+        """
+        Compiles the model.
+        
+        Parameters
+        ----------
+        R : tuple 
+            roles
+        T : dictionary
+            transition probabilities, as in pos_tagging()
+        E : dictionary or EmissionProvider
+            emission probabilities, as in pos_tagging(), whose keys are the vocabulary of the model, or a 
+            provider of the emission rows, in the order of R
+        fallback : dictionary
+            if given, and E is a dictionary, the emission probabilities of the out-of-vocabulary words, 
+            whose keys are the roles in R like those of E[s]; otherwise those words raise KeyError
+            
+        Time complexity
+        ---------------
+        O(K^2 + W*K), where W is the number of words in E; O(K^2) if E is a provider.
+        """
+        
+        self._roles = tuple(R)
+        self._roleIndex = {r: i for i, r in enumerate(self._roles)}
+        self._start, transition, self._end = transition_arrays(self._roles, T)
+        self._transition = np.ascontiguousarray(transition)
+        if isinstance(E, EmissionProvider):
+            self._emissions = E
+        else:
+            if fallback is not None:
+                fallback = [fallback.get(r, 0) for r in self._roles]
+            self._emissions = DenseEmissions.deduplicated(E, emission_array(self._roles, tuple(E), E), fallback)
+        self._logTables = None
+        self._productSlots = dict()
+        self._products = None
+        
+    @classmethod
+    def from_arrays(cls, roles, words, start, transition, end, emission, logTables=None, fallback=None):
+        """
+        Builds a model directly from its arrays, for instance the memory-mapped ones of a binary model file,
+        without walking any dictionary.
+        
+        Parameters
+        ----------
+        roles : sequence
+            the K roles
+        words : sequence
+            the W words of the vocabulary, in the order of the rows of emission
+        start, transition, end : numpy.ndarray
+            the transition probabilities, as returned by transition_arrays()
+        emission : numpy.ndarray or EmissionProvider
+            matrix of size W*K with the emission probabilities of the words, or a provider of the rows,
+            in which case words, the logarithm of emission and fallback are ignored
+        logTables : tuple
+            if given, the logarithms of start, transition, end and emission; otherwise they are computed 
+            on first use
+        fallback : sequence
+            if given, the K emission probabilities of the out-of-vocabulary words
+            
+        Returns
+        -------
+        model : TaggerModel
+            the model, which keeps references to the given arrays without copying them
+        """
+        model = cls.__new__(cls)
+        model._roles = tuple(roles)
+        model._roleIndex = {r: i for i, r in enumerate(model._roles)}
+        model._start = start
+        model._transition = np.ascontiguousarray(transition)
+        model._end = end
+        model._logTables = None if logTables is None else tuple(logTables[:3])
+        model._productSlots = dict()
+        model._products = None
+        if isinstance(emission, EmissionProvider):
+            model._emissions = emission
+        else:
+            logEmission = None if logTables is None else logTables[3]
+            model._emissions = DenseEmissions(words, emission, logEmission, fallback)
+        return model
+        
+    def roles(self):
+        """
+        Returns the tuple of the roles of the model.
+        """
+        return self._roles
+        
+    def emissions(self):
+        """
+        Returns the EmissionProvider of the model.
+        """
+        return self._emissions
+        
+    def _tables(self, log_space):
+        """
+        Returns the tuple (start, transition, end) of probabilities or log-probabilities.
+        """
+        if not log_space:
+            return self._start, self._transition, self._end
+        if self._logTables is None:
+            self._logTables = tuple(log_array(a) for a in (self._start, self._transition, self._end))
+        return self._logTables
+        
+    def cache_products(self, words, budget=2**25):
+        """
+        Precomputes the K*K matrices T ⊙ E[w], whose entry [k, i] is the probability of the transition
+        from the k-th to the i-th role times the probability that the i-th role emits w, for the emission 
+        rows that occur most often in words, so that decode_indices() tags those words with a single 
+        max-product step.
+        
+        The rows shared by several words are counted, and cached, once. The products replace those of
+        any previous call.
+        
+        The cached products are combined with the scores as probs ⊙ (T ⊙ E[w]) rather than 
+        (probs ⊙ T) ⊙ E[w], which rounds differently: the scores can differ in the last bits, so on paths
+        whose scores are near-equal (within rounding) the tags may differ from those of the other engines.
+        
+        Parameters
+        ----------
+        words : iterable
+            a sample of the words to tag, for instance the words of a corpus, where the frequency of the 
+            rows is counted; the out-of-vocabulary words are ignored
+        budget : int
+            maximum number of bytes of the products, for both the probabilities and the log-probabilities
+            
+        Returns
+        -------
+        count : int
+            the number of cached emission rows
+            
+        Time complexity
+        ---------------
+        O(N) for the N words, plus O(P*K^2) for the P cached rows.
+        """
+        
+        # Count the occurrences of every row, remembering a word that has it
+        emissions = self._emissions
+        counts = dict()
+        samples = dict()
+        for w in words:
+            i = emissions.row_id(w)
+            if i is not None:
+                counts[i] = counts.get(i, 0) + 1
+                samples.setdefault(i, w)
+        
+        K = len(self._roles)
+        count = min(len(counts), budget // max(1, 2 * K * K * 8))
+        cached = sorted(counts, key=counts.get, reverse=True)[:count]
+        self._productSlots = {i: slot for slot, i in enumerate(cached)}
+        if count == 0:
+            self._products = None
+            return 0
+        
+        products = []
+        for log_space in (False, True):
+            combine = np.add if log_space else np.multiply
+            transition = self._tables(log_space)[1]
+            rows = np.stack([emissions.row(samples[i], log_space) for i in cached])
+            products.append(combine(transition[None, :, :], rows[:, None, :]))
+        self._products = tuple(products)
+        return count
+        
+    def decode_indices(self, sentence, log_space=False, beam=None, threshold=None):
+        """
+        Returns the indices of the most likely sequence of roles of the sentence.
+        
+        Parameters
+        ----------
+        sentence : tuple
+            words in the vocabulary of the model, or out of it if the model has a fallback
+        log_space : bool
+            if True the path is decoded summing log-probabilities
+        beam : int
+            if given, the approximate viterbi_beam_arrays() is used, keeping only the beam most likely 
+            states at each position
+        threshold : float
+            if given, the approximate viterbi_beam_arrays() is used, keeping only the states whose 
+            log-probability is within threshold of the best one at each position
+            
+        Returns
+        -------
+        bestPath : numpy.ndarray
+            the indices in roles() of the most likely sequence of roles
+            
+        Time complexity
+        ---------------
+        O(K^2 * T) executed in T vectorized steps, plus O(T) dictionary lookups for the words.
+        With a beam of B states the recurrence costs O(B * K * T). The words whose products were cached 
+        by cache_products() save the K^2 multiplications by their emission, with the rounding caveat 
+        described there.
+        """
+        start, transition, end = self._tables(log_space)
+        emission, rows = self._emissions.lookup(sentence, log_space)
+        if beam is None and threshold is None:
+            if self._products is None:
+                return viterbi_arrays(start, transition, end, emission, log_space, rows)
+            slotOf = self._productSlots
+            rowId = self._emissions.row_id
+            slots = np.array([slotOf.get(rowId(w), -1) for w in sentence], dtype=np.intp)
+            return viterbi_arrays(start, transition, end, emission, log_space, rows, self._products[log_space], slots)
+        return viterbi_beam_arrays(start, transition, end, emission[rows], beam, threshold, log_space)
+        
+    def decode_checkpointed_indices(self, sentence, log_space=False, segment=None):
+        """
+        Returns the indices of the most likely sequence of roles of the sentence, like decode_indices(), 
+        using viterbi_checkpoint_arrays() which only keeps O(K * sqrt(T)) state instead of the T*K table of
+        backpointers, at the cost of computing every step twice.
+        
+        Parameters
+        ----------
+        sentence : tuple
+            words in the vocabulary of the model, or out of it if the model has a fallback
+        log_space : bool
+            if True the path is decoded summing log-probabilities
+        segment : int
+            distance between two checkpoints, by default ceil(sqrt(T))
+        """
+        start, transition, end = self._tables(log_space)
+        emission, rows = self._emissions.lookup(sentence, log_space)
+        return viterbi_checkpoint_arrays(start, transition, end, emission, log_space, rows, segment)
+        
+    def posteriors(self, sentence):
+        """
+        Computes, with the scaled forward-backward algorithm of forward_backward_arrays(), the posterior
+        probability of every role at every position of the sentence, over all the sequences of roles, 
+        and the log-likelihood of the sentence.
+        
+        Parameters
+        ----------
+        sentence : tuple
+            words in the vocabulary of the model, or out of it if the model has a fallback
+            
+        Returns
+        -------
+        marginals : numpy.ndarray
+            matrix of size T*K whose entry [j, i] is the probability that the j-th word has the i-th role
+        logLikelihood : float
+            the natural logarithm of the probability of the sentence
+        """
+        emission, rows = self._emissions.lookup(sentence)
+        return forward_backward_arrays(self._start, self._transition, self._end, emission, rows)
+        
+    def decode(self, sentence, log_space=False, beam=None, threshold=None):
+        """
+        Returns the most likely sequence of roles of the sentence, as a list of roles.
+        """
+        roles = self._roles
+        return [roles[i] for i in self.decode_indices(sentence, log_space, beam, threshold)]
+        
+    def tag(self, sentence, log_space=False, beam=None, threshold=None):
+        """
+        Returns the dictionary whose keys are the words in sentence and whose values are the roles assigned 
+        to them, like pos_tagging().
+        """
+        tags = dict()
+        roles = self._roles
+        for s, i in zip(sentence, self.decode_indices(sentence, log_space, beam, threshold)):
+            tags[s] = roles[i]
+        return tags
+        
+    def decode_batch_indices(self, sentences, log_space=False, batch_size=1024):
+        """
+        Decodes many sentences with a vectorized pass per group of sentences of the same length.
+        
+        Parameters
+        ----------
+        sentences : iterable
+            tuples of words in the vocabulary of the model, or out of it if the model has a fallback
+        log_space : bool
+            if True the paths are decoded summing log-probabilities
+        batch_size : int
+            maximum number of sentences decoded together, which bounds the B*K*K working array
+            
+        Returns
+        -------
+        paths : list
+            for each sentence, in input order, the numpy.ndarray of the indices of its most likely sequence 
+            of roles (empty for an empty sentence)
+            
+        Time complexity
+        ---------------
+        O(K^2 * N) operations for N words overall, executed in one vectorized step per position of every
+        bucket of sentences of the same length.
+        """
+        start, transition, end = self._tables(log_space)
+        
+        # Bucket the sentences by length, keeping their position in the input
+        sentences = list(sentences)
+        buckets = dict()
+        for b, sentence in enumerate(sentences):
+            buckets.setdefault(len(sentence), []).append(b)
+        
+        paths = [None] * len(sentences)
+        for length, bucket in buckets.items():
+            if length == 0:
+                for b in bucket:
+                    paths[b] = np.empty(0, dtype=np.intp)
+                continue
+            for first in range(0, len(bucket), batch_size):
+                chunk = bucket[first:first+batch_size]
+                emission, rows = self._emissions.lookup([w for b in chunk for w in sentences[b]], log_space)
+                bestPaths = viterbi_batch_arrays(start, transition, end, emission[rows.reshape(len(chunk), length)], log_space)
+                for b, path in zip(chunk, bestPaths):
+                    paths[b] = path
+        
+        return paths
+        
+    def tag_batch(self, sentences, log_space=False, batch_size=1024):
+        """
+        Returns the list of the dictionaries that tag() returns for each of the sentences, in input order,
+        computed by decode_batch_indices().
+        """
+        sentences = list(sentences)
+        roles = self._roles
+        result = []
+        for sentence, path in zip(sentences, self.decode_batch_indices(sentences, log_space, batch_size)):
+            tags = dict()
+            for s, i in zip(sentence, path):
+                tags[s] = roles[i]
+            result.append(tags)
+        return result
+
+class StreamingTagger:
+    
+    """
+    An online tagger that receives the words of a sentence one at a time and returns the tags of a prefix
+    as soon as they can no longer change.
+    
+    After each word, the backpointer chains of all the states that are still reachable are followed back:
+    when they all meet in the same state at some position, every complete path will go through that 
+    state, so the tags up to that position are final. Only the backpointers of the words whose tags have 
+    not been returned yet are kept, so the memory is bounded by the distance between two convergence 
+    points rather than by the length of the stream. The scores are always summed in log space, since 
+    products of probabilities would underflow on unbounded streams.
+    
+    The concatenation of the tags returned by push() and finish() is the same sequence that 
+    TaggerModel.decode(sentence, True) returns for the whole sentence.
+    
+    Attributes
+    ----------
+    _model : TaggerModel
+        The compiled model.
+    _probs : numpy.ndarray
+        The log-probabilities of the states at the last word, or None before the first word.
+    _backs : deque
+        The backpointers of the words after the first one whose tag has not been returned yet.
+    _pushed : int
+        The number of words pushed since the beginning of the sentence.
+    _committed : int
+        The number of tags already returned.
+        
+    Methods
+    -------
+    push(word)
+        Adds a word and returns the list of the tags that became final.
+    finish()
+        Ends the sentence applying the transitions to End and returns the remaining tags.
+    pending()
+        Returns the number of words whose tag has not been returned yet.
+    """
+    
+    def __init__(self, model):
+        """
+        Creates a streaming tagger for the given model.
+        
+        Parameters
+        ----------
+        model : TaggerModel
+            the compiled model
+        """
+        self._model = model
+        self._reset()
+        
+    def _reset(self):
+        """
+        Prepares the tagger for a new sentence.
+        """
+        self._probs = None
+        self._backs = deque()
+        self._pushed = 0
+        self._committed = 0
+        
+    def pending(self):
+        """
+        Returns the number of words whose tag has not been returned yet.
+        """
+        return self._pushed - self._committed
+    
+    def push(self, word):
+        """
+        Adds the next word of the sentence.
+        
+        Parameters
+        ----------
+        word : str
+            a word in the vocabulary of the model
+            
+        Returns
+        -------
+        tags : list
+            the roles of the words, following the ones already returned, whose tag became final; 
+            it is empty if the surviving paths do not agree yet
+            
+        Raises
+        ------
+        KeyError
+            If the word is not in the vocabulary of the model and the model has no fallback.
+            
+        Time complexity
+        ---------------
+        O(K^2) for the step of the recurrence, plus O(K * P) to follow the chains back, where P is the 
+        number of pending words.
+        """
+        start, transition, end = self._model._tables(True)
+        row = self._model._emissions.row(word, True)
+        
+        if self._probs is None:
+            self._probs = start + row
+        else:
+            self._probs, back = viterbi_step(self._probs, transition, row, True)
+            # When every word is committed the backpointers lead to a final tag, so they are not needed
+            if self.pending() > 0:
+                self._backs.append(back.astype(backpointer_dtype(len(back))))
+        self._pushed += 1
+        
+        # Follow back the chains of the surviving states until they converge
+        states = np.flatnonzero(self._probs > -np.inf)
+        if len(states) == 0:
+            states = np.arange(len(self._probs))
+        position = self._pushed - 1
+        for back in reversed(self._backs):
+            if len(states) == 1:
+                break
+            states = np.unique(back[states])
+            position -= 1
+        if len(states) > 1:
+            return []
+        return self._commit(position, states[0])
+    
+    def _commit(self, position, state):
+        """
+        Returns the tags of the pending words up to the given position, knowing that the state at 
+        that position is state, and discards their backpointers.
+        """
+        roles = self._model.roles()
+        tags = [None] * (position - self._committed + 1)
+        for j in range(position, self._committed - 1, -1):
+            tags[j - self._committed] = roles[state]
+            if j > self._committed:
+                state = self._backs[j - self._committed - 1][state]
+        
+        # The backpointers of the words up to position + 1 lead to committed words
+        for _ in range(min(position - self._committed + 1, len(self._backs))):
+            self._backs.popleft()
+        self._committed = position + 1
+        return tags
+    
+    def finish(self):
+        """
+        Ends the sentence, applying the transitions to End, and prepares the tagger for a new one.
+        
+        Returns
+        -------
+        tags : list
+            the roles of the words whose tag has not been returned by push()
+        """
+        if self._probs is None:
+            return []
+        start, transition, end = self._model._tables(True)
+        tags = self._commit(self._pushed - 1, np.argmax(self._probs + end))
+        self._reset()
+        return tags
+
+class PrefixCachedTagger:
+    
+    """
+    A tagger that caches the Viterbi columns of the prefixes of the sentences it has decoded, so that a
+    sentence sharing a prefix with a previous one resumes the recurrence from the deepest cached prefix.
+    
+    The columns are stored in a trie of words: the node reached following the first j words of a sentence 
+    holds the log-probabilities of the states at position j-1 and their backpointers. The number of cached 
+    nodes is bounded by capacity, and the least recently used ones are evicted. Every use of a node is also 
+    a use of its ancestors, which are marked as used after it, so the least recently used node is always a 
+    leaf and the path to any cached node is never broken.
+    
+    Attributes
+    ----------
+    _model : TaggerModel
+        The compiled model.
+    _logSpace : bool
+        True if the columns hold log-probabilities.
+    _capacity : int
+        The maximum number of cached columns.
+    _root : _PrefixNode
+        The node of the empty prefix, which holds no column.
+    _lru : OrderedDict
+        The cached nodes, from the least to the most recently used.
+    _hits, _misses, _evictions : int
+        The number of columns reused from the cache, computed, and evicted.
+        
+    Methods
+    -------
+    decode_indices(sentence)
+        Returns the indices of the most likely sequence of roles of the sentence.
+    tag(sentence)
+        Returns the dictionary of the roles assigned to the words of the sentence.
+    statistics()
+        Returns the counters of the cache.
+    clear()
+        Empties the cache.
+    """
+    
+    class _PrefixNode:
+        """Lightweight node of the trie of the prefixes."""
+        __slots__ = '_parent', '_word', '_children', '_probs', '_back'
+        
+        def __init__(self, parent, word, probs, back):
+            self._parent = parent
+            self._word = word
+            self._children = dict()
+            self._probs = probs
+            self._back = back
+    
+    def __init__(self, model, capacity=100000, log_space=True):
+        """
+        Creates an empty cache.
+        
+        Parameters
+        ----------
+        model : TaggerModel
+            the compiled model
+        capacity : int
+            the maximum number of cached columns; each of them takes about 10*K bytes
+        log_space : bool
+            if True the columns hold log-probabilities, as in TaggerModel.decode_indices()
+            
+        Raises
+        ------
+        ValueError
+            If capacity is not positive.
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be positive')
+        self._model = model
+        self._logSpace = log_space
+        self._capacity = capacity
+        self.clear()
+        
+    def clear(self):
+        """
+        Empties the cache and resets its counters.
+        """
+        self._root = self._PrefixNode(None, None, None, None)
+        self._lru = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        
+    def statistics(self):
+        """
+        Returns a dictionary with the number of columns reused from the cache ('hits'), computed ('misses') 
+        and evicted ('evictions'), and the number of cached columns ('size') and its bound ('capacity').
+        """
+        return {'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions,
+                'size': len(self._lru), 'capacity': self._capacity}
+        
+    def decode_indices(self, sentence):
+        """
+        Returns the indices of the most likely sequence of roles of the sentence, the same ones that 
+        TaggerModel.decode_indices(sentence, log_space) returns.
+        
+        Parameters
+        ----------
+        sentence : tuple
+            words in the vocabulary of the model, or out of it if the model has a fallback
+            
+        Returns
+        -------
+        bestPath : numpy.ndarray
+            the indices in roles() of the most likely sequence of roles
+            
+        Time complexity
+        ---------------
+        O(T) to walk down the trie plus O(K^2) for every word after the deepest cached prefix.
+        """
+        start, transition, end = self._model._tables(self._logSpace)
+        emissions = self._model._emissions
+        combine = np.add if self._logSpace else np.multiply
+        n = len(sentence)
+        
+        # Walk down the trie along the deepest cached prefix, then extend it
+        nodes = []
+        node = self._root
+        for j in range(n):
+            child = node._children.get(sentence[j])
+            if child is not None:
+                self._hits += 1
+            else:
+                row = emissions.row(sentence[j], self._logSpace)
+                if node is self._root:
+                    child = self._PrefixNode(node, sentence[j], combine(start, row), None)
+                else:
+                    probs, back = viterbi_step(node._probs, transition, row, self._logSpace)
+                    child = self._PrefixNode(node, sentence[j], probs, back.astype(backpointer_dtype(len(back))))
+                node._children[sentence[j]] = child
+                self._lru[child] = None
+                self._misses += 1
+            nodes.append(child)
+            node = child
+        
+        # The deepest nodes are marked as used first, so that every node is more recent than its descendants
+        for node in reversed(nodes):
+            if node in self._lru:
+                self._lru.move_to_end(node)
+        
+        bestPath = np.empty(n, dtype=np.intp)
+        if n > 0:
+            maxState = np.argmax(combine(nodes[n-1]._probs, end))
+            for j in range(n-1, -1, -1):
+                bestPath[j] = maxState
+                if j > 0:
+                    maxState = nodes[j]._back[maxState]
+        
+        while len(self._lru) > self._capacity:
+            self._evict(next(iter(self._lru)))
+        
+        return bestPath
+    
+    def _evict(self, node):
+        """
+        Removes node, and its descendants if any, from the cache.
+        """
+        for child in list(node._children.values()):
+            self._evict(child)
+        del node._parent._children[node._word]
+        del self._lru[node]
+        self._evictions += 1
+        
+    def tag(self, sentence):
+        """
+        Returns the dictionary whose keys are the words in sentence and whose values are the roles assigned 
+        to them, like TaggerModel.tag().
+        """
+        tags = dict()
+        roles = self._model.roles()
+        for s, i in zip(sentence, self.decode_indices(sentence)):
+            tags[s] = roles[i]
+        return tags
+
+class IncrementalTagger:
+    
+    """
+    A tagger for a sentence that is edited one word at a time, as in the interactive correction of a 
+    transcript.
+    
+    It keeps the Viterbi column of every position: the scores of the states and their backpointers.
+    The column of position j only depends on the words up to j, so replacing the j-th word only requires 
+    recomputing the columns from j onward, followed by the backtrack; the result is the same as the one 
+    of a decoding from scratch of the edited sentence.
+    
+    Attributes
+    ----------
+    _model : TaggerModel
+        The compiled model.
+    _logSpace : bool
+        True if the columns hold log-probabilities.
+    _sentence : list
+        The current words.
+    _probs : numpy.ndarray
+        Matrix of size T*K whose row j holds the scores of the states at position j.
+    _backs : numpy.ndarray
+        Matrix of size T*K whose row j holds the backpointers of the states at position j.
+    _bestPath : numpy.ndarray
+        The indices of the most likely sequence of roles of the current sentence.
+        
+    Methods
+    -------
+    sentence()
+        Returns the current words.
+    replace(j, word)
+        Replaces the j-th word and returns the indices of the new most likely sequence of roles.
+    decode_indices()
+        Returns the indices of the most likely sequence of roles of the current sentence.
+    tag()
+        Returns the dictionary of the roles assigned to the words of the current sentence.
+    """
+    
+    def __init__(self, model, sentence, log_space=True):
+        """
+        Decodes the initial sentence.
+        
+        Parameters
+        ----------
+        model : TaggerModel
+            the compiled model
+        sentence : tuple
+            words in the vocabulary of the model, or out of it if the model has a fallback
+        log_space : bool
+            if True the columns hold log-probabilities, as in TaggerModel.decode_indices()
+            
+        Raises
+        ------
+        ValueError
+            If the sentence is empty.
+        """
+        if len(sentence) == 0:
+            raise ValueError('The sentence must not be empty')
+        self._model = model
+        self._logSpace = log_space
+        self._sentence = list(sentence)
+        K = len(model.roles())
+        self._probs = np.empty((len(sentence), K), dtype=np.float64)
+        self._backs = np.zeros((len(sentence), K), dtype=backpointer_dtype(K))
+        self._update(0)
+        
+    def _update(self, first):
+        """
+        Recomputes the columns from position first onward and the most likely sequence of roles.
+        
+        Time complexity
+        ---------------
+        O(K^2 * (T - first)) for the columns plus O(T) for the backtrack.
+        """
+        start, transition, end = self._model._tables(self._logSpace)
+        emissions = self._model._emissions
+        combine = np.add if self._logSpace else np.multiply
+        n = len(self._sentence)
+        
+        for j in range(first, n):
+            row = emissions.row(self._sentence[j], self._logSpace)
+            if j == 0:
+                self._probs[0] = combine(start, row)
+            else:
+                self._probs[j], self._backs[j] = viterbi_step(self._probs[j-1], transition, row, self._logSpace)
+        
+        maxState = np.argmax(combine(self._probs[n-1], end))
+        bestPath = np.empty(n, dtype=np.intp)
+        for j in range(n-1, -1, -1):
+            bestPath[j] = maxState
+            maxState = self._backs[j, maxState]
+        self._bestPath = bestPath
+        
+    def sentence(self):
+        """
+        Returns the tuple of the current words.
+        """
+        return tuple(self._sentence)
+        
+    def replace(self, j, word):
+        """
+        Replaces the j-th word of the sentence.
+        
+        Parameters
+        ----------
+        j : int
+            the position of the word, between 0 and T-1
+        word : str
+            the new word, in the vocabulary of the model
+            
+        Returns
+        -------
+        bestPath : numpy.ndarray
+            the indices in roles() of the most likely sequence of roles of the edited sentence
+            
+        Raises
+        ------
+        IndexError
+            If j is not in the range [0, T-1].
+        KeyError
+            If the word is not in the vocabulary of the model and the model has no fallback; the sentence
+            is left unchanged.
+            
+        Time complexity
+        ---------------
+        O(K^2 * (T - j) + T), instead of the O(K^2 * T) of a decoding from scratch.
+        """
+        if j < 0 or j >= len(self._sentence):
+            raise IndexError('Index out of range')
+        self._model._emissions.row(word)
+        self._sentence[j] = word
+        self._update(j)
+        return self.decode_indices()
+        
+    def decode_indices(self):
+        """
+        Returns a copy of the indices of the most likely sequence of roles of the current sentence.
+        """
+        return self._bestPath.copy()
+        
+    def tag(self):
+        """
+        Returns the dictionary whose keys are the current words and whose values are the roles assigned 
+        to them, like TaggerModel.tag().
+        """
+        tags = dict()
+        roles = self._model.roles()
+        for s, i in zip(self._sentence, self._bestPath):
+            tags[s] = roles[i]
+        return tags
+
+def viterbi(R, S, T, E, log_space=False):
     
     """ 
     This function is the implementation of the Viterbi algorithm for the POS tagging problem. It is a dynamic
@@ -54,6 +1331,9 @@ def viterbi(R, S, T, E):
         whose keys are the strings in S and value are dictionaries E[s] such that
         - the keys of E[s] are the roles in R
         - the values in E[s] are the emission probabilities between s and the corresponding role defined by the key
+    log_space : bool
+        if True the probabilities are replaced by their logarithms (-inf for the zero entries) and the products 
+        by sums, so that the scores of long sentences do not underflow to 0.0.
     
     Returns
     -------
@@ -63,64 +1343,845 @@ def viterbi(R, S, T, E):
     Time Complexity
     ---------------
     Assuming that K is the number of states and T is the number of observations, the time complexity of this algorithm is O(K^2 * T).
-    First of all, the algorithm builds two tables of size K*T: one to hold the probability of each state given each observation, 
-    and one to hold the backpointer to the best prior state. It is necessary to determine each hidden state's probability at time 0,
-    so the time complexity is O(K). Then, for each observation, the algorithm needs to determine the probability of each state given
-    the previous observation, so the time complexity is O(K^2). Finally, the algorithm needs to determine the most likely path, so the
-    time complexity is O(T). Therefore, the total time complexity is O(K^2 * T).
+    First of all, the algorithm builds a table of size K*T to hold the backpointer to the best prior state, while only the 
+    probabilities of the previous and of the current observation are kept. It is necessary to determine each hidden state's 
+    probability at time 0, so the time complexity is O(K). Then, for each observation, the algorithm needs to determine the 
+    probability of each state given the previous observation, so the time complexity is O(K^2). Finally, the algorithm needs 
+    to determine the most likely path, so the time complexity is O(T). Therefore, the total time complexity is O(K^2 * T).
+    
+    Space Complexity
+    ----------------
+    The backpointers are the indices of the roles, stored in a flat typed array of K*T unsigned 16-bit integers (2 bytes per cell
+    when K < 2^16), plus two rows of K probabilities. For K = 50 and a sentence of 10^5 words the table takes 10 MB.
     """
     
-    # We consider two tables: one to hold the probability of each state given each observation, 
-    # and one to hold the backpointer to the best prior state.
-    probs = dict() 
-    backs = dict() 
+    if log_space:
+        T = log_table(T)
+        E = log_table(E, S)
+    
+    K = len(R)
+    
+    # We consider two rows of probabilities, for the previous and the current observation, and a table 
+    # holding the index of the best prior state of each state given each observation, where the entry of 
+    # state i at observation j is backs[j*K + i].
+    backs = array(backpointer_typecode(K), [0]) * (K * len(S))
     
     # Determine each hidden state's probability at time 0
-    for i in range(len(R)):
-        probs[R[i]] = {0: T["Start"][R[i]] * E[S[0]][R[i]]}
-        backs[R[i]] = {0: 0}
+    probs = [0.0] * K
+    for i in range(K):
+        if log_space:
+            probs[i] = T["Start"][R[i]] + E[S[0]][R[i]]
+        else:
+            probs[i] = T["Start"][R[i]] * E[S[0]][R[i]]
         
     # Tracking each state's most likely prior state and probability
     for j in range(1,len(S)):
-        for i in range(len(R)):
-            maxProb = probs[R[0]][j-1] * T[R[0]][R[i]] * E[S[j]][R[i]]
-            maxState = R[0]
-            for k in range(1,len(R)):
-                prob = probs[R[k]][j-1] * T[R[k]][R[i]] * E[S[j]][R[i]]
+        newProbs = [0.0] * K
+        for i in range(K):
+            if log_space:
+                maxProb = probs[0] + T[R[0]][R[i]] + E[S[j]][R[i]]
+            else:
+                maxProb = probs[0] * T[R[0]][R[i]] * E[S[j]][R[i]]
+            maxState = 0
+            for k in range(1,K):
+                if log_space:
+                    prob = probs[k] + T[R[k]][R[i]] + E[S[j]][R[i]]
+                else:
+                    prob = probs[k] * T[R[k]][R[i]] * E[S[j]][R[i]]
                 if prob > maxProb:
                     maxProb = prob
-                    maxState = R[k]
-            probs[R[i]][j] = maxProb
-            backs[R[i]][j] = maxState
+                    maxState = k
+            newProbs[i] = maxProb
+            backs[j*K + i] = maxState
+        probs = newProbs
     
     # Find the most likely final state
-    maxProb = probs[R[0]][len(S)-1] * T[R[0]]["End"]
-    maxState = R[0]
-    for k in range(1,len(R)):
-        prob = probs[R[k]][len(S)-1] * T[R[k]]["End"]
+    if log_space:
+        maxProb = probs[0] + T[R[0]]["End"]
+    else:
+        maxProb = probs[0] * T[R[0]]["End"]
+    maxState = 0
+    for k in range(1,K):
+        if log_space:
+            prob = probs[k] + T[R[k]]["End"]
+        else:
+            prob = probs[k] * T[R[k]]["End"]
         if prob > maxProb:
             maxProb = prob
-            maxState = R[k]
-    probs["End"] = {len(S)-1: maxProb}
-    backs["End"] = {len(S)-1: maxState}
+            maxState = k
     
-    bestPath = []
+    bestPath = [None] * len(S)
             
     # Backtrack from last observation
     for j in range(len(S)-1,-1,-1): 
-        bestPath.insert(0, maxState) # insert best state at beginning of list
-        maxState = backs[maxState][j] # set maxState to best prior state
+        bestPath[j] = R[maxState] # set the best state of position j
+        maxState = backs[j*K + maxState] # set maxState to best prior state
+        
+    return bestPath
+
+def viterbi_kbest(R, S, T, E, k, log_space=False):
+    
+    """ 
+    k-best variant of the Viterbi algorithm: it returns in a single pass the k most likely sequences of roles,
+    together with their scores.
+    
+    For every state at every position, instead of the single best prior state, it keeps the k best partial 
+    paths ending in that state, each one as its score and the (state, rank) of the partial path it extends.
+    They are selected among the K*k extensions of the partial paths of the previous position with a bounded 
+    HeapPriorityQueue, which never holds more than k items: its minimum is the worst partial path kept so 
+    far, and it is replaced whenever a better extension is found. The partial paths of each prior state are
+    sorted best first, so the scan of a prior state stops at its first extension that does not enter the heap.
+    
+    Ties are broken in favour of the prior state with the smallest index, as in viterbi(), so the first of 
+    the returned paths is the one that viterbi() returns.
+    
+    Parameters
+    ----------
+    R : tuple 
+        roles
+    S : tuple
+        words
+    T : dictionary
+        transition probabilities, as in viterbi()
+    E : dictionary
+        emission probabilities, as in viterbi()
+    k : int
+        the number of sequences to return
+    log_space : bool
+        if True the scores are sums of log-probabilities instead of products of probabilities
+    
+    Returns
+    -------
+    paths : list
+        the list of the (score, bestPath) pairs of the k most likely sequences of roles, best first; it holds 
+        fewer than k pairs only if there are fewer than k sequences of roles
+        
+    Raises
+    ------
+    ValueError
+        If k is not positive.
+
+    Time Complexity
+    ---------------
+    For every position and every state, at most K*k extensions are offered to a heap of size k, so the time 
+    complexity is O(K^2 * T * k * log k). The memory holds k partial paths per state and position, O(K * T * k).
+    """
+    
+    if k < 1:
+        raise ValueError('k must be positive')
+    if log_space:
+        T = log_table(T)
+        E = log_table(E, S)
+    
+    K = len(R)
+    
+    # best[i] is the list of the k best partial paths ending in state i, best first, each of them as the 
+    # tuple (score, prior state, rank of the partial path of the prior state)
+    best = []
+    for i in range(K):
+        if log_space:
+            best.append([(T["Start"][R[i]] + E[S[0]][R[i]], None, None)])
+        else:
+            best.append([(T["Start"][R[i]] * E[S[0]][R[i]], None, None)])
+    history = [best]
+    
+    for j in range(1, len(S)):
+        newBest = []
+        for i in range(K):
+            e = E[S[j]][R[i]]
+            heap = HeapPriorityQueue()
+            for p in range(K):
+                t = T[R[p]][R[i]]
+                for r in range(len(best[p])):
+                    if log_space:
+                        prob = best[p][r][0] + t + e
+                    else:
+                        prob = best[p][r][0] * t * e
+                    if not _offer(heap, (prob, -p, -r), k):
+                        break
+            newBest.append(_drain(heap))
+        best = newBest
+        history.append(best)
+    
+    # The k best complete paths, moving to End from any of the partial paths of the last position
+    heap = HeapPriorityQueue()
+    for p in range(K):
+        t = T[R[p]]["End"]
+        for r in range(len(best[p])):
+            if log_space:
+                prob = best[p][r][0] + t
+            else:
+                prob = best[p][r][0] * t
+            if not _offer(heap, (prob, -p, -r), k):
+                break
+    
+    paths = []
+    for score, state, rank in _drain(heap):
+        bestPath = [None] * len(S)
+        for j in range(len(S)-1, -1, -1):
+            bestPath[j] = R[state]
+            state, rank = history[j][state][rank][1:]
+        paths.append((score, bestPath))
+    
+    return paths
+
+def _offer(heap, key, k):
+    
+    """
+    Adds key to the HeapPriorityQueue heap, which holds at most k keys, if it is larger than its minimum,
+    evicting the minimum when the heap is full. Returns True if key has been added.
+    """
+    
+    if len(heap) < k:
+        heap.add(key, None)
+        return True
+    if heap.min()[0] < key:
+        heap.remove_min()
+        heap.add(key, None)
+        return True
+    return False
+
+def _drain(heap):
+    
+    """
+    Empties the heap filled by _offer() and returns its keys, best first, as (score, state, rank) tuples.
+    """
+    
+    entries = []
+    while not heap.is_empty():
+        prob, p, r = heap.remove_min()[0]
+        entries.append((prob, -p, -r))
+    entries.reverse()
+    return entries
+
+def viterbi_sparse(R, S, T, E, log_space=False):
+    
+    """ 
+    Implementation of the Viterbi algorithm for sparse models. The dictionaries T and E may omit the zero
+    probabilities, and the recurrence only visits, at each position, the roles that can emit the word and,
+    for each of them, its predecessors with a non-zero transition that are still reachable.
+    
+    A state with probability zero can only be on the best path if every path has probability zero: in that
+    case the sparse recurrence has no surviving state and the sentence is decoded by viterbi_numpy(), so the
+    result is always the same as the one of the dense engines.
+    
+    Parameters
+    ----------
+    R : tuple 
+        roles
+    S : tuple
+        words
+    T : dictionary
+        transition probabilities, as in viterbi(); missing entries are zero
+    E : dictionary
+        emission probabilities, as in viterbi(); missing entries are zero
+    log_space : bool
+        if True the recurrence sums log-probabilities instead of multiplying probabilities
+    
+    Returns
+    -------
+    bestPath : list
+        the most likely sequence of roles
+
+    Time Complexity
+    ---------------
+    Building the lists of the predecessors costs O(K + nnz(T)). Then each position costs at most O(nnz(T)),
+    and usually much less since only the roles with a non-zero emission are visited, so the total time 
+    complexity is O(nnz(T) * T) instead of O(K^2 * T).
+    """
+    
+    index = {r: i for i, r in enumerate(R)}
+    convert = (lambda p: math.log(p)) if log_space else (lambda p: p)
+    
+    # For every role, the list of its predecessors with a non-zero transition, in increasing order of index
+    predecessors = [[] for _ in range(len(R))]
+    for k in range(len(R)):
+        for r, p in T[R[k]].items():
+            if p > 0 and r in index:
+                predecessors[index[r]].append((k, convert(p)))
+    for i in range(len(R)):
+        predecessors[i].sort()
+    
+    # For every word, the list of the roles with a non-zero emission
+    emissions = dict()
+    for s in S:
+        if s not in emissions:
+            emissions[s] = sorted((index[r], convert(p)) for r, p in E[s].items() if p > 0)
+    
+    # probs holds only the states with non-zero probability, backs the best prior state of each of them
+    probs = dict()
+    for i, e in emissions[S[0]]:
+        t = T["Start"].get(R[i], 0)
+        if t > 0:
+            probs[i] = convert(t) + e if log_space else t * e
+    backs = [None]
+    
+    for j in range(1, len(S)):
+        newProbs = dict()
+        back = dict()
+        for i, e in emissions[S[j]]:
+            maxProb = None
+            for k, t in predecessors[i]:
+                if k in probs:
+                    if log_space:
+                        prob = probs[k] + t + e
+                    else:
+                        prob = probs[k] * t * e
+                    if maxProb is None or prob > maxProb:
+                        maxProb = prob
+                        maxState = k
+            # In probability space a product may also underflow to zero
+            if maxProb is not None and (log_space or maxProb > 0):
+                newProbs[i] = maxProb
+                back[i] = maxState
+        probs = newProbs
+        backs.append(back)
+    
+    # Find the most likely final state among the ones that can reach End
+    maxProb = None
+    for k in sorted(probs):
+        t = T[R[k]].get("End", 0)
+        if t > 0:
+            prob = probs[k] + convert(t) if log_space else probs[k] * t
+            if maxProb is None or prob > maxProb:
+                maxProb = prob
+                maxState = k
+    if maxProb is None or (not log_space and maxProb == 0):
+        return viterbi_numpy(R, S, T, E, log_space)
+    
+    bestPath = [None] * len(S)
+    for j in range(len(S)-1, -1, -1):
+        bestPath[j] = R[maxState]
+        if j > 0:
+            maxState = backs[j][maxState]
+    
+    return bestPath
+
+def viterbi_numpy(R, S, T, E, log_space=False):
+    
+    """ 
+    Vectorized implementation of the Viterbi algorithm. The dictionaries T and E are converted once into
+    dense arrays, then every time step is computed as a single broadcasted max/argmax over a K*K matrix 
+    instead of the two inner Python loops of viterbi().
+    
+    The products are evaluated in the same order as in viterbi(), namely (probs * T) * E, and argmax
+    returns the first maximum just like the strict comparison in viterbi(), so the two functions return 
+    exactly the same path.
+    
+    Parameters
+    ----------
+    R : tuple 
+        roles
+    S : tuple
+        words
+    T : dictionary
+        transition probabilities, as in viterbi()
+    E : dictionary
+        emission probabilities, as in viterbi()
+    log_space : bool
+        if True the recurrence sums log-probabilities (-inf for the zero entries) instead of multiplying 
+        probabilities, as in viterbi()
+    
+    Returns
+    -------
+    bestPath : list
+        the most likely sequence of roles
+
+    Time Complexity
+    ---------------
+    Assuming that K is the number of states and T is the number of observations, the conversion of the 
+    dictionaries costs O(K^2 + K * T) and the recurrence still performs O(K^2 * T) operations, but they are 
+    executed by NumPy in T vectorized steps instead of K^2 * T interpreted ones.
+    """
+    
+    start, transition, end = transition_arrays(R, T)
+    emission = emission_array(R, S, E)
+    
+    if log_space:
+        start, transition, end, emission = log_array(start), log_array(transition), log_array(end), log_array(emission)
+    
+    return [R[i] for i in viterbi_arrays(start, transition, end, emission, log_space)]
+
+def viterbi_arrays(start, transition, end, emission, log_space=False, rows=None, products=None, slots=None):
+    
+    """ 
+    The Viterbi recurrence on dense arrays, shared by viterbi_numpy() and TaggerModel.
+    
+    Parameters
+    ----------
+    start : numpy.ndarray
+        array of size K with the (log-)probabilities of the transitions from Start
+    transition : numpy.ndarray
+        matrix of size K*K with the (log-)probabilities of the transitions between roles
+    end : numpy.ndarray
+        array of size K with the (log-)probabilities of the transitions to End
+    emission : numpy.ndarray
+        matrix of size T*K whose row j holds the (log-)probabilities of the emission of the j-th word
+    log_space : bool
+        True if the arrays hold log-probabilities, that are summed instead of multiplied
+    rows : sequence
+        if given, emission is the table of a whole vocabulary and the emission of the j-th word is in 
+        emission[rows[j]], so that the T*K matrix of the sentence is never materialized
+    products : numpy.ndarray
+        if given, array of size P*K*K of precomputed combinations of transition with emission rows, as
+        built by TaggerModel.cache_products(), which explains how they affect the rounding
+    slots : sequence
+        if products is given, slots[j] is the index in products of the combination of transition with the 
+        emission of the j-th word, which replaces both of them, or -1 if there is none
         
+    Returns
+    -------
+    bestPath : numpy.ndarray
+        the indices of the most likely sequence of roles
+    
+    Time Complexity
+    ---------------
+    O(K^2 * T), executed in T vectorized steps.
+    
+    Space Complexity
+    ----------------
+    Only the row of probabilities of the previous position is kept, while the backpointers are stored in a 
+    T*K table of uint16 (see backpointer_dtype()): for K = 50 and T = 10^5 the peak memory is about 11 MB, 
+    10 MB for the backpointers plus the 0.8 MB of the returned path.
+    """
+    
+    combine = np.add if log_space else np.multiply
+    K = emission.shape[1]
+    if rows is None:
+        rows = range(emission.shape[0])
+    n = len(rows)
+    
+    # Probability of each hidden state at time 0
+    probs = combine(start, emission[rows[0]])
+    backs = np.empty((n, K), dtype=backpointer_dtype(K))
+    
+    columns = np.arange(K)
+    for j in range(1, n):
+        if products is None or slots[j] < 0:
+            probs, backs[j] = viterbi_step(probs, transition, emission[rows[j]], log_space)
+        else:
+            scores = combine(probs[:, None], products[slots[j]])
+            back = np.argmax(scores, axis=0)
+            probs = scores[back, columns]
+            backs[j] = back
+    
+    # Find the most likely final state and backtrack from the last observation
+    maxState = np.argmax(combine(probs, end))
+    bestPath = np.empty(n, dtype=np.intp)
+    for j in range(n-1, -1, -1):
+        bestPath[j] = maxState
+        maxState = backs[j, maxState]
+    
     return bestPath
+
+def forward_backward_arrays(start, transition, end, emission, rows=None):
+    
+    """ 
+    Scaled forward-backward algorithm on dense arrays of probabilities.
+    
+    The forward probabilities of each position are normalized to sum to one, and the logarithms of the 
+    normalization constants add up to the log-likelihood of the sentence; the backward probabilities are 
+    normalized in the same way. Every intermediate value therefore stays in a fixed range, whatever the 
+    length of the sentence, and the products never underflow.
+    
+    Parameters
+    ----------
+    start, transition, end, emission : numpy.ndarray
+        the probabilities, as in viterbi_arrays()
+    rows : sequence
+        if given, the emission of the j-th word is in emission[rows[j]], as in viterbi_arrays()
         
+    Returns
+    -------
+    marginals : numpy.ndarray
+        matrix of size T*K whose entry [j, i] is the posterior probability of state i at position j;
+        all zeros if the sentence has probability zero
+    logLikelihood : float
+        the natural logarithm of the probability of the sentence, including the transitions from Start 
+        and to End; -inf if the sentence has probability zero
+    
+    Time Complexity
+    ---------------
+    O(K^2 * T), executed in 2*T vectorized vector-matrix products, in O(K * T) memory.
+    """
+    
+    K = emission.shape[1]
+    if rows is None:
+        rows = range(emission.shape[0])
+    n = len(rows)
+    
+    # Forward pass: alpha[j] is proportional to the probability of the first j+1 words and state i at j
+    alpha = np.empty((n, K), dtype=np.float64)
+    logLikelihood = 0.0
+    probs = start * emission[rows[0]]
+    for j in range(n):
+        if j > 0:
+            probs = (alpha[j-1] @ transition) * emission[rows[j]]
+        scale = probs.sum()
+        if scale == 0:
+            return np.zeros((n, K), dtype=np.float64), -math.inf
+        alpha[j] = probs / scale
+        logLikelihood += math.log(scale)
+    scale = alpha[n-1] @ end
+    if scale == 0:
+        return np.zeros((n, K), dtype=np.float64), -math.inf
+    logLikelihood += math.log(scale)
+    
+    # Backward pass: beta is proportional to the probability of the words after j given state i at j,
+    # and the marginals are proportional to alpha[j] * beta
+    marginals = alpha
+    beta = end / end.max()
+    for j in range(n-1, -1, -1):
+        if j < n-1:
+            beta = transition @ (emission[rows[j+1]] * beta)
+            beta /= beta.max()
+        marginals[j] *= beta
+        marginals[j] /= marginals[j].sum()
+    
+    return marginals, logLikelihood
+
+def viterbi_step(probs, transition, emission, log_space=False):
+    
+    """ 
+    A single step of the Viterbi recurrence on dense arrays.
+    
+    Parameters
+    ----------
+    probs : numpy.ndarray
+        array of size K with the (log-)probabilities of the states at the previous position
+    transition : numpy.ndarray
+        matrix of size K*K with the (log-)probabilities of the transitions between roles
+    emission : numpy.ndarray
+        array of size K with the (log-)probabilities of the emission of the current word
+    log_space : bool
+        True if the arrays hold log-probabilities
         
+    Returns
+    -------
+    newProbs : numpy.ndarray
+        array of size K with the (log-)probabilities of the states at the current position
+    back : numpy.ndarray
+        array of size K with the index of the best prior state of each state
+    
+    Time Complexity
+    ---------------
+    O(K^2), executed as a single vectorized step.
+    """
+    
+    combine = np.add if log_space else np.multiply
+    
+    # Entry [k, i] of scores is the probability of reaching state i from state k
+    scores = combine(combine(probs[:, None], transition), emission)
+    back = np.argmax(scores, axis=0)
+    return scores[back, np.arange(len(probs))], back
+
+def viterbi_checkpoint_arrays(start, transition, end, emission, log_space=False, rows=None, segment=None):
+    
+    """ 
+    Viterbi recurrence in sublinear memory, for sequences too long to keep the T*K table of backpointers.
+    
+    The forward pass keeps only the probabilities of the states at one position out of segment, the 
+    checkpoints. Then the path is recovered from the last segment to the first: the backpointers of a 
+    segment are recomputed starting from its checkpoint, and the path is followed back to the checkpoint,
+    whose state is the end of the previous segment. Every recomputed step performs the same operations 
+    as the forward pass, so the result is identical to the one of viterbi_arrays().
+    
+    Parameters
+    ----------
+    start, transition, end, emission : numpy.ndarray
+        the (log-)probabilities, as in viterbi_arrays()
+    log_space : bool
+        True if the arrays hold log-probabilities
+    rows : sequence
+        if given, the emission of the j-th word is in emission[rows[j]], as in viterbi_arrays()
+    segment : int
+        distance between two checkpoints, by default ceil(sqrt(T))
         
+    Returns
+    -------
+    bestPath : numpy.ndarray
+        the indices of the most likely sequence of roles
+        
+    Raises
+    ------
+    ValueError
+        If segment is not positive.
+    
+    Time Complexity
+    ---------------
+    Every step is computed twice, once in the forward pass and once in the recomputation of its segment,
+    so the time complexity is still O(K^2 * T), about twice the one of viterbi_arrays().
+    
+    Space Complexity
+    ----------------
+    O(K * (T/segment + segment)) besides the input and the returned path, that is O(K * sqrt(T)) with the 
+    default segment: T/segment checkpoints of K probabilities and the K*segment backpointers of a segment.
+    """
+    
+    combine = np.add if log_space else np.multiply
+    K = emission.shape[1]
+    if rows is None:
+        rows = range(emission.shape[0])
+    n = len(rows)
+    if segment is None:
+        segment = max(1, math.isqrt(n - 1) + 1)
+    if segment < 1:
+        raise ValueError('segment must be positive')
+    
+    # Forward pass, keeping the probabilities at positions 0, segment, 2*segment, ...
+    probs = combine(start, emission[rows[0]])
+    checkpoints = [probs]
+    for j in range(1, n):
+        probs = viterbi_step(probs, transition, emission[rows[j]], log_space)[0]
+        if j % segment == 0:
+            checkpoints.append(probs)
+    
+    maxState = np.argmax(combine(probs, end))
+    bestPath = np.empty(n, dtype=np.intp)
+    bestPath[n-1] = maxState
+    
+    # Backward pass: the segment c covers the positions from c*segment to min((c+1)*segment, n-1), 
+    # and the state at its last position is already known
+    backs = np.empty((segment + 1, K), dtype=backpointer_dtype(K))
+    for c in range(len(checkpoints) - 1, -1, -1):
+        first = c * segment
+        last = min(first + segment, n - 1)
+        probs = checkpoints[c]
+        for j in range(first + 1, last + 1):
+            probs, backs[j - first] = viterbi_step(probs, transition, emission[rows[j]], log_space)
+        maxState = bestPath[last]
+        for j in range(last, first, -1):
+            maxState = backs[j - first, maxState]
+            bestPath[j - 1] = maxState
+        checkpoints[c] = None
+    
+    return bestPath
 
-            
+def viterbi_beam_arrays(start, transition, end, emission, beam=None, threshold=None, log_space=False):
+    
+    """ 
+    Approximate Viterbi recurrence with beam pruning: at each position only the most likely states are 
+    extended, namely the beam best ones and/or those whose log-probability is within threshold of the 
+    best one. The pruned states are not considered as predecessors of the next position, so the path 
+    may differ from the one of viterbi_arrays(), which is the result obtained when nothing is pruned.
+    
+    Parameters
+    ----------
+    start, transition, end, emission : numpy.ndarray
+        the (log-)probabilities, as in viterbi_arrays()
+    beam : int
+        maximum number of states kept at each position, or None for no limit
+    threshold : float
+        maximum difference between the log-probability of the best state and the one of a kept state,
+        or None for no limit
+    log_space : bool
+        True if the arrays hold log-probabilities
+        
+    Returns
+    -------
+    bestPath : numpy.ndarray
+        the indices of the most likely sequence of roles among the ones that survive the pruning
+        
+    Raises
+    ------
+    ValueError
+        If beam is not positive or threshold is negative.
+    
+    Time Complexity
+    ---------------
+    O(B * K * T) plus O(K * T) for the selection of the states, where B <= K is the number of states 
+    kept at each position.
+    """
+    
+    if beam is not None and beam < 1:
+        raise ValueError('beam must be positive')
+    if threshold is not None and threshold < 0:
+        raise ValueError('threshold must be non negative')
+    
+    combine = np.add if log_space else np.multiply
+    n, K = emission.shape
+    
+    probs = combine(start, emission[0])
+    backs = np.empty((n, K), dtype=backpointer_dtype(K))
+    
+    for j in range(1, n):
+        # Select the surviving states, in increasing order so that ties are broken as in viterbi_arrays()
+        active = np.arange(K)
+        if beam is not None and beam < K:
+            active = np.sort(np.argpartition(probs, K - beam)[K - beam:])
+        if threshold is not None:
+            best = probs[active].max()
+            bound = best - threshold if log_space else best * math.exp(-threshold)
+            active = active[probs[active] >= bound]
+        
+        # Entry [a, i] of scores is the probability of reaching state i at time j from state active[a]
+        scores = combine(combine(probs[active, None], transition[active]), emission[j])
+        best = np.argmax(scores, axis=0)
+        backs[j] = active[best]
+        probs = scores[best, np.arange(K)]
+    
+    maxState = np.argmax(combine(probs, end))
+    bestPath = np.empty(n, dtype=np.intp)
+    for j in range(n-1, -1, -1):
+        bestPath[j] = maxState
+        maxState = backs[j, maxState]
+    
+    return bestPath
+
+def viterbi_batch_arrays(start, transition, end, emission, log_space=False):
+    
+    """ 
+    The Viterbi recurrence of viterbi_arrays() applied at once to B sentences of the same length.
+    
+    Parameters
+    ----------
+    start, transition, end : numpy.ndarray
+        the (log-)probabilities of the transitions, as in viterbi_arrays()
+    emission : numpy.ndarray
+        array of size B*T*K whose entry [b, j, i] is the (log-)probability of the emission of the j-th word
+        of the b-th sentence by the i-th role
+    log_space : bool
+        True if the arrays hold log-probabilities
+        
+    Returns
+    -------
+    bestPaths : numpy.ndarray
+        matrix of size B*T whose row b holds the indices of the most likely sequence of roles of the b-th
+        sentence, equal to viterbi_arrays(start, transition, end, emission[b], log_space)
+    
+    Time Complexity
+    ---------------
+    O(B * K^2 * T), executed in T vectorized steps.
+    """
+    
+    combine = np.add if log_space else np.multiply
+    B, n, K = emission.shape
+    
+    probs = combine(start[None, :], emission[:, 0])
+    backs = np.empty((n, B, K), dtype=backpointer_dtype(K))
+    
+    # The predecessors are laid out on the last axis, so that the reductions scan contiguous memory,
+    # and the B*K*K working array is allocated only once
+    transposed = np.ascontiguousarray(transition.T)
+    scores = np.empty((B, K, K), dtype=np.float64)
+    
+    # Entry [b, i, k] of scores is the probability of reaching state i at time j from state k in sentence b
+    for j in range(1, n):
+        combine(probs[:, None, :], transposed[None, :, :], out=scores)
+        combine(scores, emission[:, j, :, None], out=scores)
+        backs[j] = np.argmax(scores, axis=2)
+        probs = np.take_along_axis(scores, backs[j][:, :, None], axis=2)[:, :, 0]
+    
+    # Find the most likely final states and backtrack from the last observation
+    maxStates = np.argmax(combine(probs, end[None, :]), axis=1)
+    batch = np.arange(B)
+    bestPaths = np.empty((B, n), dtype=np.intp)
+    for j in range(n-1, -1, -1):
+        bestPaths[:, j] = maxStates
+        maxStates = backs[j, batch, maxStates]
+    
+    return bestPaths
+
+def backpointer_dtype(K):
+    
+    """
+    Returns the smallest unsigned integer NumPy type that can hold the index of any of K roles.
+    """
+    
+    return np.uint16 if K <= 1 << 16 else np.uint32
+
+def backpointer_typecode(K):
+    
+    """
+    Returns the typecode of the smallest unsigned integer array.array that can hold the index of any of K roles.
+    """
+    
+    return 'H' if K <= 1 << 16 else 'L'
+
+def transition_arrays(R, T):
+    
+    """
+    Converts the transition dictionary into dense arrays indexed by the position of the roles in R.
+    
+    Parameters
+    ----------
+    R : tuple
+        roles
+    T : dictionary
+        transition probabilities, as in viterbi(); missing entries are zero
+        
+    Returns
+    -------
+    start : numpy.ndarray
+        array of size K such that start[i] = T['Start'][R[i]]
+    transition : numpy.ndarray
+        matrix of size K*K such that transition[k, i] = T[R[k]][R[i]]
+    end : numpy.ndarray
+        array of size K such that end[k] = T[R[k]]['End']
+    """
+    
+    start = np.array([T["Start"].get(r, 0) for r in R], dtype=np.float64)
+    transition = np.array([[T[r1].get(r2, 0) for r2 in R] for r1 in R], dtype=np.float64).reshape(len(R), len(R))
+    end = np.array([T[r].get("End", 0) for r in R], dtype=np.float64)
+    
+    return start, transition, end
 
+def emission_array(R, S, E):
     
+    """
+    Converts the emission probabilities of the words in S into a dense array.
     
+    Parameters
+    ----------
+    R : tuple
+        roles
+    S : tuple
+        words
+    E : dictionary
+        emission probabilities, as in viterbi(); missing entries are zero
+        
+    Returns
+    -------
+    emission : numpy.ndarray
+        matrix of size T*K such that emission[j, i] = E[S[j]][R[i]]
+    """
     
+    return np.array([[E[s].get(r, 0) for r in R] for s in S], dtype=np.float64).reshape(len(S), len(R))
+
+def log_array(a):
     
+    """
+    Returns the natural logarithm of the array a, mapping the zero entries to -inf without warnings.
+    """
+    
+    with np.errstate(divide='ignore'):
+        return np.log(a)
 
-    
\ No newline at end of file
+def log_table(table, keys=None):
+    
+    """
+    Returns a copy of the nested dictionary table (T or E) where every probability p is replaced by log(p),
+    and the zero probabilities by -inf.
+    
+    Parameters
+    ----------
+    table : dictionary
+        a dictionary of dictionaries of probabilities
+    keys : iterable
+        if given, only the entries table[key] for key in keys are converted
+        
+    Returns
+    -------
+    logTable : dictionary
+        the nested dictionary of log-probabilities
+    """
+    
+    if keys is None:
+        keys = table.keys()
+    
+    logTable = dict()
+    for key in keys:
+        if key not in logTable:
+            logTable[key] = {r: math.log(p) if p > 0 else -math.inf for r, p in table[key].items()}
+    
+    return logTable
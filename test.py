@@ -1,17 +1,34 @@
-from pos_tagging import pos_tagging
-from DeviceSelection import DeviceSelection
+from pos_tagging import pos_tagging, pos_tagging_batch, viterbi_kbest, TaggerModel, StreamingTagger, PrefixCachedTagger, IncrementalTagger, ENGINES
+from pos_parallel import tag_corpus, pos_tagging_corpus
+from pos_model_file import compile_dataset, load_model
+from pos_service import TaggingService
+from pos_benchmark import random_hmm
+from DeviceSelection import DeviceSelection, ENGINES as DEVICE_ENGINES
 from time import time
+import asyncio
+import tracemalloc
+import tempfile
+import os
 
-def pos_read_data():
-    f = open("pos_dataset1/transition",'r')
+def pos_read_names(path, prefix, count):
+    # The roles and sentence files are optional: when they are missing we fall back to 
+    # synthetic names built from the line index
+    try:
+        f = open(path, 'r')
+    except FileNotFoundError:
+        return [prefix + str(i) for i in range(count)]
+    names = []
+    for i in range(count):
+        names.append(f.readline().strip())
+    f.close()
+    return names
+
+def pos_read_data(folder="pos_dataset1"):
+    f = open(folder + "/transition",'r')
     t = dict()
     t["Start"] = dict()
     words = f.readline().split()
-    r = open("pos_dataset1/roles", 'r')
-    roles=[]
-    for i in range(len(words)-1):
-        roles.append(r.readline().strip())
-    r.close()
+    roles = pos_read_names(folder + "/roles", 'R', len(words)-1)
     for i in range(len(words)-1):
         t['Start'][roles[i]]=float(words[i])
     t['Start']['End']=float(words[len(words)-1])
@@ -25,35 +42,28 @@ def pos_read_data():
         j += 1
     f.close()
 
-    f = open("pos_dataset1/emission",'r')
-    s = open("pos_dataset1/sentence",'r')
+    f = open(folder + "/emission",'r')
+    lines = f.readlines()
+    f.close()
+    sentence = pos_read_names(folder + "/sentence", 'W', len(lines))
     e = dict()
-    j = s.readline().strip()
-    for line in f:
-        e[j] = dict()
-        words = line.split()
+    for j in range(len(lines)):
+        e[sentence[j]] = dict()
+        words = lines[j].split()
         for i in range(len(words)):
-            e[j][roles[i]] = float(words[i])
-        j = s.readline().strip()
-    f.close()
-    s.close()
+            e[sentence[j]][roles[i]] = float(words[i])
 
     return t, e
 
-def pos_read_sol(r_num):
-    f = open("pos_dataset1/sol",'r')
-    r = open("pos_dataset1/roles", 'r')
-    w = open("pos_dataset1/sentence",'r')
+def pos_read_sol(r_num, folder="pos_dataset1"):
+    f = open(folder + "/sol",'r')
     s = dict()
     words = f.readline().split()
-    roles=[]
-    for i in range(r_num):
-        roles.append(r.readline().strip())
-    r.close()
+    roles = pos_read_names(folder + "/roles", 'R', r_num)
+    sentence = pos_read_names(folder + "/sentence", 'W', len(words))
     for i in range(len(words)):
-        s[w.readline().strip()]=roles[int(words[i])]
+        s[sentence[i]]=roles[int(words[i])]
     f.close()
-    w.close()
 
     return s
 
@@ -72,19 +82,229 @@ def pos_read_sol(r_num):
 # E['Jane']={'Noun': 1, 'Modal': 0, 'Verb': 0}
 # out={'Will': 'Modal', 'Mary': 'Noun', 'Spot': 'Verb', 'Jane': 'Noun'}
 
-T, E = pos_read_data()
-R = tuple(T.keys())[1:len(T)]
-S = tuple(E.keys())
-start = time()
-sol = pos_tagging(R, S, T, E)
-end = time()-start
-out = pos_read_sol(len(T)-1)
+# The toy model again, with the zero probabilities omitted
+T=dict()
+T['Start']={'Noun': 3/4, 'Modal': 1/4}
+T['Noun']={'Noun': 1/9, 'Modal': 3/9, 'Verb': 1/9, 'End': 4/9}
+T['Modal']={'Noun': 1/4, 'Verb': 3/4}
+T['Verb']={'Noun': 1}
+E=dict()
+E['Will']={'Noun': 1/4, 'Modal': 3/4}
+E['Mary']={'Noun': 1}
+E['Spot']={'Noun': 1/2, 'Verb': 1/2}
+E['Jane']={'Noun': 1}
+out={'Will': 'Modal', 'Mary': 'Noun', 'Spot': 'Verb', 'Jane': 'Noun'}
+for engine in ('numpy', 'sparse'):
+    if pos_tagging(('Noun', 'Modal', 'Verb'), ('Will', 'Mary', 'Spot', 'Jane'), T, E, engine) != out:
+        print('toy', engine, 'FAIL')
+    else:
+        print('toy', engine, 'True')
+
+# Streaming the toy model commits the whole sentence after Mary, before the chains of Spot converge
+def stream(model, sentence):
+    streaming = StreamingTagger(model)
+    tags = []
+    for s in sentence:
+        tags += streaming.push(s)
+    return tags + streaming.finish()
+
+if stream(TaggerModel(('Noun', 'Modal', 'Verb'), T, E), ('Will', 'Mary', 'Spot', 'Jane')) != [out[s] for s in out]:
+    print('toy', 'streaming', 'FAIL')
+else:
+    print('toy', 'streaming', 'True')
+
+# Sparse random models, whose chains often converge on the last word pushed
+for seed in range(50):
+    R, S, T, E = random_hmm(6, 12, 0.3, seed)
+    model = TaggerModel(R, T, E)
+    if stream(model, S) != list(model.decode(S, True)):
+        print('sparse', seed, 'streaming', 'FAIL')
+        break
+else:
+    print('sparse', 'streaming', 'True')
+
+# Tagging a sentence only compiles its own words, so it takes about the same time with a large vocabulary
+def best_time(function, *args):
+    best = float('inf')
+    for _ in range(3):
+        start = time()
+        function(*args)
+        best = min(best, time()-start)
+    return best
+
+R, S, T, E = random_hmm(50, 20000, 0.5, 0)
+sentence = S[:10]
+small = {s: E[s] for s in sentence}
+large = best_time(pos_tagging, R, sentence, T, E) + best_time(pos_tagging_batch, R, [sentence] * 4, T, E)
+reference = best_time(pos_tagging, R, sentence, T, small) + best_time(pos_tagging_batch, R, [sentence] * 4, T, small)
+if large > 5 * reference + 0.005:
+    print('vocabulary', 'FAIL', large, reference)
+else:
+    print('vocabulary', 'True')
+    print(large)
+
+for folder in ("pos_dataset1", "pos_dataset2", "pos_dataset3"):
+    T, E = pos_read_data(folder)
+    R = tuple(T.keys())[1:len(T)]
+    S = tuple(E.keys())
+    out = pos_read_sol(len(T)-1, folder)
+    for engine in ENGINES:
+        for log_space in (False, True):
+            start = time()
+            sol = pos_tagging(R, S, T, E, engine, log_space)
+            end = time()-start
+
+            if sol != out:
+                print(folder, engine, 'log' if log_space else 'prob', 'FAIL')
+            else:
+                print(folder, engine, 'log' if log_space else 'prob', 'True')
+                print(end)
+
+    if dict(zip(S, stream(TaggerModel(R, T, E), S))) != out:
+        print(folder, 'streaming', 'FAIL')
+    else:
+        print(folder, 'streaming', 'True')
 
-if sol != out:
-    print('FAIL')
+    # Positional output, which keeps a tag for every occurrence of a repeated word
+    repeated = S + S
+    reference = pos_tagging(R, repeated, T, E, 'python', output='roles')
+    for engine in ENGINES:
+        roles = pos_tagging(R, S, T, E, engine, output='roles')
+        indices = pos_tagging(R, repeated, T, E, engine, output='indices')
+        if roles != [out[s] for s in S] or reference != [R[i] for i in indices]:
+            print(folder, engine, 'positional', 'FAIL')
+        else:
+            print(folder, engine, 'positional', 'True')
+
+    kbest = viterbi_kbest(R, S, T, E, 3, True)
+    if len(kbest) != 3 or dict(zip(S, kbest[0][1])) != out or not kbest[0][0] >= kbest[1][0] >= kbest[2][0]:
+        print(folder, 'kbest', 'FAIL')
+    else:
+        print(folder, 'kbest', 'True')
+
+    # The likelihood of the sentence is at least the probability of its best path
+    marginals, logLikelihood = TaggerModel(R, T, E).posteriors(S)
+    if abs(marginals.sum(axis=1) - 1).max() > 1e-9 or logLikelihood < kbest[0][0] - 1e-9:
+        print(folder, 'posteriors', 'FAIL')
+    else:
+        print(folder, 'posteriors', 'True')
+
+    # Checkpointed decoding, with the default segment, one checkpoint per word and a segment that does
+    # not divide the length of the sentence
+    model = TaggerModel(R, T, E)
+    checkpointed = True
+    for log_space in (False, True):
+        reference = list(model.decode_indices(S, log_space))
+        for segment in (None, 1, 7, len(S)//3 + 1):
+            if list(model.decode_checkpointed_indices(S, log_space, segment)) != reference:
+                checkpointed = False
+    if not checkpointed:
+        print(folder, 'checkpointed', 'FAIL')
+    else:
+        print(folder, 'checkpointed', 'True')
+
+    # Precomputed transition-emission products for every word of the sentence
+    products = TaggerModel(R, T, E)
+    if products.cache_products(S) == 0 or products.tag(S) != out or products.tag(S, True) != out:
+        print(folder, 'products', 'FAIL')
+    else:
+        print(folder, 'products', 'True')
+
+    # The second sentence resumes from the cached columns of the first one
+    cache = PrefixCachedTagger(TaggerModel(R, T, E), capacity=len(S))
+    cache.tag(S[:len(S)//2])
+    if cache.tag(S) != out or cache.statistics()['hits'] != len(S)//2:
+        print(folder, 'prefix cache', 'FAIL')
+    else:
+        print(folder, 'prefix cache', 'True')
+
+    # Replacing a word and restoring it must give back the original tags
+    incremental = IncrementalTagger(TaggerModel(R, T, E), S)
+    edited = list(S)
+    edited[len(S)//2] = S[0]
+    changed = incremental.replace(len(S)//2, S[0])
+    incremental.replace(len(S)//2, S[len(S)//2])
+    if incremental.tag() != out or list(changed) != list(TaggerModel(R, T, E).decode_indices(edited, True)):
+        print(folder, 'incremental', 'FAIL')
+    else:
+        print(folder, 'incremental', 'True')
+
+    # Binary model file, mapped in memory
+    with tempfile.TemporaryDirectory() as directory:
+        modelFile = os.path.join(directory, 'model.hmm')
+        compile_dataset(folder, modelFile)
+        mapped = load_model(modelFile)
+        if mapped.tag(S) != out or mapped.tag(S, True) != out:
+            print(folder, 'model file', 'FAIL')
+        else:
+            print(folder, 'model file', 'True')
+        del mapped
+
+        # Emission rows copied out of the file on demand, at most 8 of them kept between two sentences
+        lazy = load_model(modelFile, capacity=8)
+        if lazy.tag(S) != out or lazy.tag(S, True) != out or lazy.emissions().statistics()['size'] > 8:
+            print(folder, 'lazy emissions', 'FAIL')
+        else:
+            print(folder, 'lazy emissions', 'True')
+        del lazy
+
+    # An out-of-vocabulary word takes the fallback distribution, which leaves the known words decodable
+    fallback = TaggerModel(R, T, E, fallback={r: 1 / len(R) for r in R})
+    try:
+        TaggerModel(R, T, E).tag(S + ('<unknown>',))
+        print(folder, 'fallback', 'FAIL')
+    except KeyError:
+        if fallback.tag(S) != out or len(fallback.decode(S + ('<unknown>',), True)) != len(S) + 1:
+            print(folder, 'fallback', 'FAIL')
+        else:
+            print(folder, 'fallback', 'True')
+
+    halves = [S[:len(S)//2], S, S[len(S)//2:]]
+    batch = pos_tagging_batch(R, halves, T, E)
+    if batch[1] != out or batch[0] != pos_tagging(R, halves[0], T, E) or batch[2] != pos_tagging(R, halves[2], T, E):
+        print(folder, 'batch', 'FAIL')
+    else:
+        print(folder, 'batch', 'True')
+
+# Peak memory of the decoding of a 100k-word sentence with the 50 roles of the last dataset: the backpointers
+# take 2 bytes per cell (10 MB), the probabilities only two rows
+model = TaggerModel(R, T, E)
+longSentence = S * (100000 // len(S))
+tracemalloc.start()
+model.decode_indices(longSentence, True)
+peak = tracemalloc.get_traced_memory()[1]
+tracemalloc.stop()
+if peak > 16 * 2**20:
+    print('memory', 'FAIL', peak)
+else:
+    print('memory', 'True')
+    print(peak)
+
+# Concurrent requests to the micro-batching service, one of them with an unknown word
+async def service_requests(sentences):
+    service = TaggingService(model, max_batch_size=8, max_wait=0.001)
+    results = await asyncio.gather(*(service.tag(s) for s in sentences), return_exceptions=True)
+    await service.close()
+    return results
+
+requests = [S[j:j+10] for j in range(0, len(S), 5)]
+results = asyncio.run(service_requests(requests + [('<unknown>',)]))
+if results[:-1] != [model.tag(s) for s in requests] or not isinstance(results[-1], KeyError):
+    print('service', 'FAIL')
 else:
-    print('True')
-    print(end)
+    print('service', 'True')
+
+# Parallel tagging of a corpus; the pool starts worker processes, so it only runs from the script itself
+if __name__ == '__main__':
+    try:
+        tag_corpus(model, requests, workers=0)
+        rejected = False
+    except ValueError:
+        rejected = True
+    if not rejected or pos_tagging_corpus(R, requests, T, E, workers=2, chunk_size=3) != [pos_tagging(R, s, T, E) for s in requests]:
+        print('parallel', 'FAIL')
+    else:
+        print('parallel', 'True')
 
 #Testing DeviceSelection
 def dominates(a, b):
@@ -110,9 +330,9 @@ def verify(data,partition):
         return False
     return True
 
-def dev_read_data():
+def dev_read_data(folder="dev_dataset1"):
     data = dict()
-    f = open("dev_dataset1/data",'r')
+    f = open(folder + "/data",'r')
     for line in f:
         sline=line.split()
         data[sline[0].strip()] = []
@@ -121,9 +341,9 @@ def dev_read_data():
     f.close()
     return data
 
-def dev_read_sol():
+def dev_read_sol(folder="dev_dataset1"):
     sol = []
-    f = open("dev_dataset1/devsol",'r')
+    f = open(folder + "/devsol",'r')
     for line in f:
         sline=line.split()
         subset=[]
@@ -137,24 +357,26 @@ def dev_read_sol():
 # X = 7
 # data = {'Device 1': (100, 99, 85, 77, 63), 'Device 2': (101, 88, 82, 75, 60), 'Device 3': (98, 89, 84, 76, 61), 'Device 4': (110, 65, 65, 67, 80), 'Device 5': (95, 80, 80, 63, 60)}
 # partition = [['Device 1', 'Device 3', 'Device 5'], ['Device 2'], ['Device 4']]
-data = dev_read_data()
-N = tuple(data.keys())
-X = len(data['D0'])+2
-
-start = time()
-ds=DeviceSelection(N, X, data)
-C=ds.countDevices()
-subsets = [[] for i in range(C)]
-for i in range(C):
-    dev = ds.nextDevice(i)
-    while dev is not None:
-        subsets[i].append(dev)
-        dev = ds.nextDevice(i)
-end=time()-start
-
-partition = dev_read_sol()
-if not verify(data, subsets) or C > len(partition):
-    print('FAIL')
-else:
-    print('True')
-    print(end)
+for folder in ("dev_dataset1", "dev_dataset2", "dev_dataset3"):
+    data = dev_read_data(folder)
+    N = tuple(data.keys())
+    X = len(data['D0'])+2
+    partition = dev_read_sol(folder)
+    
+    for engine in DEVICE_ENGINES:
+        start = time()
+        ds=DeviceSelection(N, X, data)
+        C=ds.countDevices(engine)
+        subsets = [[] for i in range(C)]
+        for i in range(C):
+            dev = ds.nextDevice(i)
+            while dev is not None:
+                subsets[i].append(dev)
+                dev = ds.nextDevice(i)
+        end=time()-start
+
+        if not verify(data, subsets) or C > len(partition):
+            print(folder, engine, 'FAIL')
+        else:
+            print(folder, engine, 'True')
+            print(end)